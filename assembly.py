@@ -1,24 +1,208 @@
 #!/usr/bin/env python2
 
 # Packages
-from collections import OrderedDict
+from collections import OrderedDict, MutableMapping
+from itertools import product
+import os
+import re
+import time
+import hashlib
+import numpy as np
+import threading
+from cStringIO import StringIO
+
+# Model context
+class Model(object):
+
+    # Owns the registries and ID counters of one model. The module-level
+    # dictionaries, constructors and add_* routines act on the active model,
+    # which is the innermost "with Model():" block of the current thread or
+    # the default model outside of any block. Only the registries, indexes,
+    # caches, statistics and counters are isolated; the settings, cmfd and
+    # axial_surfaces dictionaries of make_assembly stay module globals that
+    # create_core and create_cmfd update, so two models built in one
+    # process share them.
+    def __init__(self, id_offset=0):
+
+        # Registries
+        self.surf_dict = OrderedDict()
+        self.cell_dict = OrderedDict()
+        self.mat_dict = OrderedDict()
+        self.univ_dict = OrderedDict()
+        self.lat_dict = OrderedDict()
+        self.plot_dict = OrderedDict()
+        self.axial_dict = OrderedDict()
+
+        # Interning index of (type, bc, binned coefficients) -> surface key
+        self.surf_index = {}
+
+        # Index of universe content (cell regions and fills) -> universe key
+        self.univ_index = {}
+
+        # Caches of model builders, e.g. water compositions
+        self.caches = {}
+
+        # Build statistics, None unless enable_stats() is called
+        self.stats = None
+
+        # Item counters
+        self.n_materials = id_offset
+        self.n_surfaces = id_offset
+        self.n_cells = id_offset
+        self.n_universes = id_offset
+        self.n_lattices = id_offset
+        self.n_plots = id_offset
+
+    def __enter__(self):
+        model_stack().append(self)
+        return self
+
+    def __exit__(self, *args):
+        model_stack().pop()
+
+    def cache(self, key):
+        return self.caches.setdefault(key, OrderedDict())
+
+    def max_id(self):
+        return max(self.n_materials, self.n_surfaces, self.n_cells, self.n_universes, self.n_plots)
+
+_default_model = Model()
+_local = threading.local()
+
+def model_stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+def active_model():
+    stack = model_stack()
+    if len(stack) > 0:
+        return stack[-1]
+    return _default_model
+
+class ActiveDict(MutableMapping):
+
+    # Stands in for one registry of the active model
+    def __init__(self, name):
+        self.name = name
+
+    def __getitem__(self, key):
+        return getattr(active_model(), self.name)[key]
+
+    def __setitem__(self, key, value):
+        getattr(active_model(), self.name)[key] = value
+
+    def __delitem__(self, key):
+        del getattr(active_model(), self.name)[key]
+
+    def __iter__(self):
+        return iter(getattr(active_model(), self.name))
+
+    def __len__(self):
+        return len(getattr(active_model(), self.name))
+
+    def __contains__(self, key):
+        return key in getattr(active_model(), self.name)
+
+    def has_key(self, key):
+        return key in getattr(active_model(), self.name)
+
+    def update(self, *args, **kwargs):
+        getattr(active_model(), self.name).update(*args, **kwargs)
+
+    def keys(self):
+        return getattr(active_model(), self.name).keys()
+
+    def values(self):
+        return getattr(active_model(), self.name).values()
+
+    def items(self):
+        return getattr(active_model(), self.name).items()
+
+    def itervalues(self):
+        return getattr(active_model(), self.name).itervalues()
+
+    def iteritems(self):
+        return getattr(active_model(), self.name).iteritems()
+
+    def __repr__(self):
+        return repr(getattr(active_model(), self.name))
+
+class BuildStats(object):
+
+    # Stage timers, entity counters and bytes per output file of one build
+    def __init__(self, callback=None):
+        self.stages = OrderedDict()
+        self.calls = OrderedDict()
+        self.counts = OrderedDict()
+        self.files = OrderedDict()
+        self.callback = callback
+
+    def add_time(self, name, seconds, calls=1):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + calls
+
+    def count(self, kind, n=1):
+        self.counts[kind] = self.counts.get(kind, 0) + n
+
+    def merge(self, other):
+        # Fold in the statistics of a worker, stage times are summed
+        for name, seconds in other.stages.iteritems():
+            self.add_time(name, seconds, other.calls[name])
+        for kind, n in other.counts.iteritems():
+            self.count(kind, n)
+        self.files.update(other.files)
+
+    def report(self):
+        return OrderedDict([
+            ('stages', OrderedDict([(name, OrderedDict([('time', seconds), ('calls', self.calls[name])]))
+                                    for name, seconds in self.stages.iteritems()])),
+            ('counts', self.counts),
+            ('files', self.files),
+            ('bytes', sum(self.files.values()))])
+
+class Stage(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+
+    def __exit__(self, *args):
+        self.stats.add_time(self.name, time.time() - self.start)
+
+class NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+_null_stage = NullStage()
 
 # Global Dictionaries
-surf_dict = OrderedDict() 
-cell_dict = OrderedDict() 
-mat_dict = OrderedDict()
-univ_dict = OrderedDict()
-lat_dict = OrderedDict()
-plot_dict = OrderedDict()
-axial_dict = OrderedDict()
-
-# Item counters
-n_materials = 0
-n_surfaces = 0
-n_cells = 0
-n_universes = 0
-n_lattices = 0
-n_plots = 0
+surf_dict = ActiveDict('surf_dict')
+cell_dict = ActiveDict('cell_dict')
+mat_dict = ActiveDict('mat_dict')
+univ_dict = ActiveDict('univ_dict')
+lat_dict = ActiveDict('lat_dict')
+plot_dict = ActiveDict('plot_dict')
+axial_dict = ActiveDict('axial_dict')
+
+# Surfaces whose type, boundary condition and coefficients agree to within
+# this tolerance are interned to a single surface by add_surface
+surf_tolerance = 1.0e-6
+
+# Bytes buffered per output file by the streaming writers
+xml_buffer_size = 1 << 20
+
+# Cells using union, complement or parentheses are written as regions
+region_operators = re.compile(r'[|~()]')
 
 # Global templates
 pin_lattice ="""
@@ -43,11 +227,34 @@ pin_lattice ="""
 {sw:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {so:>4} {se:>4}
 """
 
+# Key of each position of the template, rows listed north to south
+pin_layout = [re.findall(r'\{(\w+):>4\}', line) for line in pin_lattice.strip('\n').split('\n')]
+
+# String interning, repeated types, comments and regions share one copy
+def intern_str(value):
+    if isinstance(value, str):
+        return intern(value)
+    return value
+
 # Class Definitions
-class Element(object):
+class XMLItem(object):
+
+    # Items stream their XML straight to a file handle; write_xml is kept
+    # for callers that still want the string. All items use __slots__ and
+    # interned strings so that pin-resolved decks stay compact in memory.
+    __slots__ = ()
+
+    def write_xml(self):
+        fh = StringIO()
+        self.stream_xml(fh)
+        return fh.getvalue()
+
+class Element(XMLItem):
+    __slots__ = ('name', 'xs', 'value')
+
     def __init__(self, name, xs, value):
-        self.name = name
-        self.xs = xs
+        self.name = intern_str(name)
+        self.xs = intern_str(xs)
         self.value = value
 
     def display(self):
@@ -55,15 +262,15 @@ class Element(object):
         print '    XS: {0}'.format(self.xs)
         print '    Value: {0}'.format(self.value)
 
-    def write_xml(self):
-        xml_str = ""
-        xml_str += """    <element name="{name}" xs="{xs}" ao="{value}" />\n""".format(name = self.name, xs = self.xs, value = self.value)
-        return xml_str
+    def stream_xml(self, fh):
+        fh.write("""    <element name="{name}" xs="{xs}" ao="{value}" />\n""".format(name = self.name, xs = self.xs, value = self.value))
+
+class Nuclide(XMLItem):
+    __slots__ = ('name', 'xs', 'value')
 
-class Nuclide(object):
     def __init__(self, name, xs, value):
-        self.name = name
-        self.xs = xs
+        self.name = intern_str(name)
+        self.xs = intern_str(xs)
         self.value = value
 
     def display(self):
@@ -71,36 +278,37 @@ class Nuclide(object):
         print '    XS: {0}'.format(self.xs)
         print '    Value: {0}'.format(self.value)
 
-    def write_xml(self):
-        xml_str = ""
-        xml_str += """    <nuclide name="{name}" xs="{xs}" ao="{value}" />\n""".format(name = self.name, xs = self.xs, value = self.value)
-        return xml_str
+    def stream_xml(self, fh):
+        fh.write("""    <nuclide name="{name}" xs="{xs}" ao="{value}" />\n""".format(name = self.name, xs = self.xs, value = self.value))
+
+class Sab(XMLItem):
+    __slots__ = ('name', 'xs')
 
-class Sab(object):
     def __init__(self, name, xs):
-        self.name = name
-        self.xs = xs
+        self.name = intern_str(name)
+        self.xs = intern_str(xs)
 
     def display(self):
         print '    Name: {0}'.format(self.name)
         print '    XS: {0}'.format(self.xs)
 
-    def write_xml(self):
-        xml_str = ""
-        xml_str += """    <sab name="{name}" xs="{xs}" />\n""".format(name = self.name, xs = self.xs)
-        return xml_str
+    def stream_xml(self, fh):
+        fh.write("""    <sab name="{name}" xs="{xs}" />\n""".format(name = self.name, xs = self.xs))
+
+class Material(XMLItem):
+    __slots__ = ('id', 'elements', 'nuclides', 'sab', 'key', 'comment', 'color')
 
-class Material(object):
     def __init__(self, key, comment = None):
-        global n_materials
-        n_materials += 1
-        self.id = n_materials
+        model = active_model()
+        model.n_materials += 1
+        self.id = model.n_materials
         self.elements = []
         self.nuclides = []
         self.sab = None
-        self.key = key
-        self.comment = comment
+        self.key = intern_str(key)
+        self.comment = intern_str(comment)
         self.color = None 
+        count_entity('materials')
 
     def add_element(self, name, xs, value):
         self.elements.append(Element(name, xs, value))
@@ -112,7 +320,7 @@ class Material(object):
         self.sab = Sab(name, xs)
 
     def add_color(self, color):
-        self.color = color
+        self.color = intern_str(color)
 
     def finalize(self):
         if mat_dict.has_key(self.key):
@@ -134,30 +342,30 @@ class Material(object):
         if self.color != None:
             print 'Color: {0}'.format(self.color)
 
-    def write_xml(self):
-        xml_str = ""
+    def stream_xml(self, fh):
         if self.comment != None:
-            xml_str += """  <!--{0:^40}-->\n""".format(self.comment)
-        xml_str += """  <material id="{id:>6}">\n""".format(id = self.id)
-        xml_str += """    <density units="sum" />\n"""
+            fh.write("""  <!--{0:^40}-->\n""".format(self.comment))
+        fh.write("""  <material id="{id:>6}">\n""".format(id = self.id))
+        fh.write("""    <density units="sum" />\n""")
         for item in self.elements:
-            xml_str += item.write_xml()
+            item.stream_xml(fh)
         for item in self.nuclides:
-            xml_str += item.write_xml()
+            item.stream_xml(fh)
         if self.sab != None:
-            xml_str += self.sab.write_xml()
-        xml_str += """  </material>\n"""
-        return xml_str
+            self.sab.stream_xml(fh)
+        fh.write("""  </material>\n""")
+
+class Surface(XMLItem):
+    __slots__ = ('id', 'type', 'coeffs', 'bc', 'comment')
 
-class Surface(object):
     def __init__(self, type, coeffs = "", bc=None, comment=None):
-        global n_surfaces
-        n_surfaces += 1
-        self.id = n_surfaces
-        self.type = type
+        model = active_model()
+        model.n_surfaces += 1
+        self.id = model.n_surfaces
+        self.type = intern_str(type)
         self.coeffs = coeffs
-        self.bc = bc
-        self.comment = comment
+        self.bc = intern_str(bc)
+        self.comment = intern_str(comment)
 
     def display(self):
         print '\nSurface ID: {0}'.format(self.id)
@@ -168,25 +376,25 @@ class Surface(object):
         if self.comment != None:
             print 'COMMENT: {0}'.format(self.comment)
 
-    def write_xml(self):
-        xml_str = ""
+    def stream_xml(self, fh):
         if self.bc == None:
-          xml_str += """  <surface id="{id:>6}" type="{type:<17}" coeffs="{coeffs:>25}"/>""".format(id = self.id, type = self.type, coeffs = self.coeffs)
+          fh.write("""  <surface id="{id:>6}" type="{type:<17}" coeffs="{coeffs:>25}"/>""".format(id = self.id, type = self.type, coeffs = self.coeffs))
         else:
-          xml_str += """  <surface id="{id:>6}" type="{type:<17}" coeffs="{coeffs:>25}" boundary="{bc}"/>""".format(id = self.id, type = self.type, coeffs = self.coeffs, bc = self.bc)
+          fh.write("""  <surface id="{id:>6}" type="{type:<17}" coeffs="{coeffs:>25}" boundary="{bc}"/>""".format(id = self.id, type = self.type, coeffs = self.coeffs, bc = self.bc))
         if self.comment != None:
-            xml_str += """  <!--{0:^40}-->""".format(self.comment)
-        xml_str += "\n"
-        return xml_str
+            fh.write("""  <!--{0:^40}-->""".format(self.comment))
+        fh.write("\n")
 
 class Universe(object):
+    __slots__ = ('id', 'cells')
+
     def __init__(self, value=None):
-        global n_universes
         if value != None:
             self.id = value 
         else:
-            n_universes += 1
-            self.id = n_universes
+            model = active_model()
+            model.n_universes += 1
+            self.id = model.n_universes
         self.cells = []
 
     def add_cell(self, key):
@@ -196,22 +404,21 @@ class Universe(object):
         print '\nUniverse ID: {0}'.format(self.id)
         print 'Cells: {0}'.format(self.cells)
 
-class Cell(object):
-    n_cells = 0
+class Cell(XMLItem):
+    __slots__ = ('id', 'fill', 'material', 'surfaces', 'universe', 'comment')
+
     def __init__(self, surfaces, universe=None, fill=None, material=None, comment=None):
-        global n_cells
-        n_cells += 1
-        self.id = n_cells
+        model = active_model()
+        model.n_cells += 1
+        self.id = model.n_cells
         self.fill = fill
         self.material = material
-        self.surfaces = surfaces
+        self.surfaces = intern_str(surfaces)
         self.universe = universe
-        self.comment = comment
-        self.checked = False
+        self.comment = intern_str(comment)
 
         # check cell setup
-        self.checked = self.check_cell()
-        if not self.checked:
+        if not self.check_cell():
             raise Exception('Cell needs fill or material!')
 
     def check_cell(self):
@@ -232,34 +439,43 @@ class Cell(object):
         if self.comment != None:
             print 'Comment: {0}'.format(self.comment)
 
-    def write_xml(self):
-        xml_str = ""
+    def stream_xml(self, fh):
+
+        # Unions and complements are only understood in a region attribute
+        attr = 'surfaces'
+        if region_operators.search(self.surfaces):
+            attr = 'region'
         if self.fill == None:
-          xml_str += """  <cell id="{id:>6}" universe="{univ:<6}" material="{mat:>6}" surfaces="{surfs:>12}"/>""".format(id = self.id, univ = self.universe, mat = self.material, surfs = self.surfaces)
+          fh.write("""  <cell id="{id:>6}" universe="{univ:<6}" material="{mat:>6}" {attr}="{surfs:>12}"/>""".format(id = self.id, univ = self.universe, mat = self.material, attr = attr, surfs = self.surfaces))
         else:
-          xml_str += """  <cell id="{id:>6}" universe="{univ:<6}" fill="{fill:>10}" surfaces="{surfs:>12}"/>""".format(id = self.id, univ = self.universe, fill = self.fill, surfs = self.surfaces)
+          fh.write("""  <cell id="{id:>6}" universe="{univ:<6}" fill="{fill:>10}" {attr}="{surfs:>12}"/>""".format(id = self.id, univ = self.universe, fill = self.fill, attr = attr, surfs = self.surfaces))
         if self.comment != None:
-            xml_str += """  <!--{0:^40}-->""".format(self.comment)
-        xml_str += "\n"
-        return xml_str
+            fh.write("""  <!--{0:^40}-->""".format(self.comment))
+        fh.write("\n")
         
 
-class Lattice(object):
+class Lattice(XMLItem):
+    __slots__ = ('id', 'type', 'dimension', 'lower_left', 'width', 'universes', 'comment', 'nx', 'ny')
+
     def __init__(self, dimension, lower_left, width, universes, comment=None):
-        global n_lattices, n_universes
-        n_lattices += 1
-        n_universes += 1
-        self.id = n_universes
+        model = active_model()
+        model.n_lattices += 1
+        model.n_universes += 1
+        self.id = model.n_universes
         self.type = "rectangular"
-        self.dimension = dimension
-        self.lower_left = lower_left
-        self.width = width
-        self.universes = pin_lattice.format(**universes)
-        self.comment = comment
+        self.dimension = intern_str(dimension)
+        self.lower_left = intern_str(lower_left)
+        self.width = intern_str(width)
+        if isinstance(universes, dict):
+            universes = [[universes[key] for key in row] for row in pin_layout]
+        self.universes = np.array(universes, dtype=np.int32)
+        self.comment = intern_str(comment)
 
         # Get lattice dimension
         self.nx = dimension.split()[0]
         self.ny = dimension.split()[1]
+        if self.universes.shape != (int(self.ny), int(self.nx)):
+            raise Exception('Lattice universes do not match dimension - ' + dimension)
 
     def display(self):
         print '\nLattice ID: {0}'.format(self.id)
@@ -271,22 +487,29 @@ class Lattice(object):
         if self.comment != None:
           print 'Comment: {0}'.format(self.comment)
 
-    def write_xml(self):
-        xml_str = "\n"
+    def render_universes(self):
+        # Rows of right-aligned IDs, formatted in one pass over the array
+        ny, nx = self.universes.shape
+        row = ' '.join(['%4d']*nx) + '\n'
+        return '\n' + (row*ny) % tuple(self.universes.ravel().tolist())
+
+    def stream_xml(self, fh):
+        fh.write("\n")
         if self.comment != None:
-            xml_str += """  <!--{0:^40}-->\n""".format(self.comment)
-        xml_str += """  <lattice id="{id:>6}" type="{type}" dimension="{dim}">\n""".format(id = self.id, type = self.type, dim = self.dimension)
-        xml_str += """    <lower_left>{lleft}</lower_left>\n""".format(lleft = self.lower_left)
-        xml_str += """    <width>{width}</width>\n""".format(width = self.width)
-        xml_str += """    <universes>{univs}    </universes>\n""".format(univs = self.universes)
-        xml_str += """  </lattice>\n"""
-        return xml_str
-
-class Plot(object):
+            fh.write("""  <!--{0:^40}-->\n""".format(self.comment))
+        fh.write("""  <lattice id="{id:>6}" type="{type}" dimension="{dim}">\n""".format(id = self.id, type = self.type, dim = self.dimension))
+        fh.write("""    <lower_left>{lleft}</lower_left>\n""".format(lleft = self.lower_left))
+        fh.write("""    <width>{width}</width>\n""".format(width = self.width))
+        fh.write("""    <universes>{univs}    </universes>\n""".format(univs = self.render_universes()))
+        fh.write("""  </lattice>\n""")
+
+class Plot(XMLItem):
+    __slots__ = ('id', 'origin', 'width', 'basis', 'type', 'color', 'pixels', 'background', 'filename', 'comment')
+
     def __init__(self, origin, width, basis, type='slice', color='mat', pixels="1000 1000", background='255 0 0', filename=None, comment=None):
-        global n_plots
-        n_plots += 1
-        self.id = n_plots
+        model = active_model()
+        model.n_plots += 1
+        self.id = model.n_plots
         self.origin = origin
         self.width = width
         self.basis = basis
@@ -312,24 +535,25 @@ class Plot(object):
         if self.comment != None:
             print 'Comment: {0}'.format(self.comment)
 
-    def write_xml(self):
-        xml_str = "\n"
+    def stream_xml(self, fh, col_spec=None):
+        if col_spec == None:
+            col_spec = color_specs()
+        fh.write("\n")
         if self.comment != None:
-            xml_str += """  <!--{0:^40}-->\n""".format(self.comment)
-        xml_str += """  <plot id="{id}" type="{type}" color="{col}">\n""".format(id = self.id, type = self.type, col = self.color)
-        xml_str += """      <filename>{fname}</filename>\n""".format(fname = self.filename)
-        xml_str += """      <origin> {origin} </origin>\n""".format(origin = self.origin)
-        xml_str += """      <width> {width} </width>\n""".format(width = self.width)
-        xml_str += """      <basis> {basis} </basis>\n""".format(basis = self.basis)
-        xml_str += """      <pixels>{pixels}</pixels>\n""".format(pixels = self.pixels)
-        xml_str += """      <background>{background}</background>\n""".format(background = self.background)
-        for item in mat_dict.keys():
-            if mat_dict[item].color != None:
-                xml_str += """      <col_spec id="{id}" rgb="{rgb}"/>\n""".format(id = mat_dict[item].id, rgb = mat_dict[item].color)
-        xml_str += """  </plot>\n"""
-        return xml_str
+            fh.write("""  <!--{0:^40}-->\n""".format(self.comment))
+        fh.write("""  <plot id="{id}" type="{type}" color="{col}">\n""".format(id = self.id, type = self.type, col = self.color))
+        fh.write("""      <filename>{fname}</filename>\n""".format(fname = self.filename))
+        fh.write("""      <origin> {origin} </origin>\n""".format(origin = self.origin))
+        fh.write("""      <width> {width} </width>\n""".format(width = self.width))
+        fh.write("""      <basis> {basis} </basis>\n""".format(basis = self.basis))
+        fh.write("""      <pixels>{pixels}</pixels>\n""".format(pixels = self.pixels))
+        fh.write("""      <background>{background}</background>\n""".format(background = self.background))
+        fh.write(col_spec)
+        fh.write("""  </plot>\n""")
 
 class AxialRegion(object):
+    __slots__ = ('bottom', 'top', 'dp', 'grid', 'water_idx', 'cool_rho')
+
     def __init__(self, bottom, top, dp, grid, water_idx, cool_rho):
         self.bottom = bottom
         self.top = top
@@ -347,10 +571,128 @@ class AxialRegion(object):
         print 'Top: {0} {1}'.format(self.top, surf_dict[self.top].coeffs)
 
 # Global Routines
+def new(cls, **values):
+    # Item with its slots set directly, without taking a new ID
+    item = cls.__new__(cls)
+    for name, value in values.iteritems():
+        setattr(item, name, value)
+    return item
+
+def item_state(item):
+    # Plain nested tuple of an item's slot values, used for content hashes
+    if isinstance(item, (list, tuple)):
+        return tuple([item_state(value) for value in item])
+    if isinstance(item, np.ndarray):
+        return (item.dtype.str, item.shape, item.tobytes())
+    if hasattr(item, '__slots__'):
+        return (type(item).__name__,) + tuple([item_state(getattr(item, name)) for name in item.__slots__])
+    return item
+
+def fingerprint(items):
+    # SHA-1 over the state of a sequence of items
+    sha = hashlib.sha1()
+    for item in items:
+        sha.update(repr(item_state(item)))
+    return sha.hexdigest()
+
+def color_specs():
+    # <col_spec> block of the material colors, shared by all plots of a
+    # write and kept until a material color changes
+    colors = tuple([(item.id, item.color) for item in unique_values(mat_dict) if item.color != None])
+    cache = active_model().cache('col_spec')
+    if not cache.has_key(colors):
+        cache.clear()
+        cache.update({colors:''.join(["""      <col_spec id="{id}" rgb="{rgb}"/>\n""".format(id = id, rgb = rgb)
+                                      for id, rgb in colors])})
+    return cache[colors]
+
+def enable_stats(callback=None):
+    # Collect build statistics on the active model; the callback gets the
+    # report from finish_stats()
+    active_model().stats = BuildStats(callback)
+    return active_model().stats
+
+def stage(name):
+    # Timer for a "with" block, free of cost while statistics are off
+    stats = active_model().stats
+    if stats == None:
+        return _null_stage
+    return Stage(stats, name)
+
+def count_entity(kind, n=1):
+    stats = active_model().stats
+    if stats != None:
+        stats.count(kind, n)
+
+def count_file(filename):
+    stats = active_model().stats
+    if stats != None:
+        stats.files[os.path.basename(filename)] = os.path.getsize(filename)
+
+def finish_stats():
+    # Report of the active model's statistics, also handed to the callback
+    stats = active_model().stats
+    if stats == None:
+        return None
+    report = stats.report()
+    if stats.callback != None:
+        stats.callback(report)
+    return report
+
+def set_id_offset(offset):
+    # Start numbering new items after offset, used to give separately built
+    # models disjoint ID ranges
+    model = active_model()
+    model.n_materials = model.n_surfaces = model.n_cells = offset
+    model.n_universes = model.n_lattices = model.n_plots = offset
+
+def unique_values(dict_):
+    # Interned entries are stored under several keys, yield each object once
+    seen = set()
+    for item in dict_.itervalues():
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        yield item
+
+def find_surface(type, coeffs, bc=None):
+    # Look for an interned surface in this and the neighbouring tolerance bins
+    surf_index = active_model().surf_index
+    values = [float(c) for c in coeffs.split()]
+    bins = [int(round(v/surf_tolerance)) for v in values]
+    for shift in product((0, -1, 1), repeat=len(bins)):
+        sig = (type, bc, tuple(b + s for b, s in zip(bins, shift)))
+        if not surf_index.has_key(sig):
+            continue
+        surf = surf_dict[surf_index[sig]]
+        other = [float(c) for c in surf.coeffs.split()]
+        if max([abs(a - b) for a, b in zip(values, other)] + [0.0]) <= surf_tolerance:
+            return surf_index[sig]
+    return None
+
 def add_surface(key, type, coeffs, bc=None, comment=None):
     if surf_dict.has_key(key):
         raise Exception('Duplicate surface key - '+key)
+
+    # Reuse a coincident surface if one exists
+    match = find_surface(type, coeffs, bc)
+    if match != None:
+        surf_dict.update({key:surf_dict[match]})
+        count_entity('surface_aliases')
+        return surf_dict[key].id
+
+    # Add the surface and index it
     surf_dict.update({key:Surface(type, coeffs, bc, comment)})
+    index_surface(key)
+    count_entity('surfaces')
+    return surf_dict[key].id
+
+def index_surface(key):
+    # Make a registered surface findable by find_surface, the first key of
+    # a surface stays the one it is found under
+    surf = surf_dict[key]
+    bins = tuple([int(round(float(c)/surf_tolerance)) for c in surf.coeffs.split()])
+    active_model().surf_index.setdefault((surf.type, surf.bc, bins), key)
 
 def add_cell(key, surfaces, universe=None, fill=None, material=None, comment=None):
     if cell_dict.has_key(key):
@@ -372,17 +714,76 @@ def add_cell(key, surfaces, universe=None, fill=None, material=None, comment=Non
 
     # Add the cell
     cell_dict.update({key:Cell(surfaces, universe, fill, material, comment)})
+    count_entity('cells')
+
+def collapse_universe(key):
+    # Universes whose cells have the same regions and fills are structurally
+    # identical, so a repeat is folded into the first one and its cells dropped
+    univ_index = active_model().univ_index
+    univ = univ_dict[key]
+    sig = tuple([(cell_dict[c].surfaces, cell_dict[c].fill, cell_dict[c].material) for c in univ.cells])
+    if not univ_index.has_key(sig):
+        univ_index.update({sig:key})
+        return univ.id
+    match = univ_dict[univ_index[sig]]
+    if match is not univ:
+        for cell in univ.cells:
+            del cell_dict[cell]
+        univ_dict.update({key:match})
+        count_entity('collapsed_universes')
+    return match.id
+
+def coalesce_cells(universe):
+    # Merge neighbouring slab cells ("bottom -top") of a universe that are
+    # filled with equivalent lattices into one cell over the combined range
+    univ = univ_dict[universe]
+    lat_ids = dict([(lat_dict[key].id, key) for key in lat_dict.keys()])
+    def content(cell):
+        lat = lat_dict[lat_ids[cell.fill]]
+        return (lat.type, lat.dimension, lat.lower_left, lat.width, lat.universes.tobytes())
+    def slab(cell):
+        surfs = cell.surfaces.split()
+        if len(surfs) != 2 or surfs[0].startswith('-') or not surfs[1].startswith('-'):
+            return None
+        if not lat_ids.has_key(cell.fill):
+            return None
+        return surfs
+    cells = []
+    for key in univ.cells:
+        cell = cell_dict[key]
+        if len(cells) > 0:
+            prev = cell_dict[cells[-1]]
+            prev_slab = slab(prev)
+            this_slab = slab(cell)
+            if prev_slab != None and this_slab != None and prev_slab[1][1:] == this_slab[0] and \
+               content(prev) == content(cell):
+                prev.surfaces = '{0} {1}'.format(prev_slab[0], this_slab[1])
+                del cell_dict[key]
+                count_entity('coalesced_cells')
+                continue
+        cells.append(key)
+    univ.cells = cells
+
+    # Drop lattices that no cell is filled with anymore
+    fills = set([cell.fill for cell in cell_dict.itervalues()])
+    for key in lat_dict.keys():
+        if lat_dict[key].id not in fills:
+            del lat_dict[key]
 
 def add_lattice(key, dimension, lower_left, width, universes, comment=None):
     if lat_dict.has_key(key):
          raise Exception('Duplicate lattice key - '+key)
     lat_dict.update({key:Lattice(dimension, lower_left, width, universes, comment)})
+    count_entity('lattices')
 
 def add_plot(key, origin, width, basis, type='slice', color='mat', pixels="1000 1000", background='255 0 0', filename=None, comment=None):
     if plot_dict.has_key(key):
          raise Exception('Duplicate plot key - '+key)
     plot_dict.update({key:Plot(origin, width, basis, type, color, pixels, background, filename, comment)})
+    count_entity('plots')
+
 def add_axial(key, bottom, top, dp, grid, water_idx, cool_rho):
     if axial_dict.has_key(key):
         raise Exception('Duplicate axial key - '+key)
     axial_dict.update({key:AxialRegion(bottom, top, dp, grid, water_idx, cool_rho)})
+    count_entity('axial_regions')
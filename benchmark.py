@@ -0,0 +1,135 @@
+#!/usr/bin/env python2
+
+# Packages
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+
+# Benchmark points, a water mesh sweep on one assembly and an assembly count
+# sweep on square cores at the default water mesh
+water_points = [25, 50, 100, 250, 500, 1000, 2500, 5000]
+core_sizes = [1, 3, 7, 15]
+core_types = ['3.1bp', '2.4', '1.6', '2.4bp', '3.1']
+history_file = 'benchmark_history.json'
+
+def main():
+
+    # Water points given on the command line replace the default sweep
+    waters = water_points
+    sizes = core_sizes
+    if len(sys.argv) > 1:
+        waters = [int(item) for item in sys.argv[1].split(',')]
+    if len(sys.argv) > 2:
+        sizes = [int(item) for item in sys.argv[2].split(',')]
+    record = run_benchmark(waters, sizes)
+    display_record(record)
+
+def run_benchmark(waters=water_points, sizes=core_sizes, history=history_file):
+
+    points = []
+    for n in waters:
+        points.append(OrderedDict([('n_water', n), ('assemblies', 1)]))
+    for n in sizes:
+        if n > 1:
+            points.append(OrderedDict([('n_water', None), ('assemblies', n*n), ('core_size', n)]))
+
+    # One point at a time so the timings do not compete for cores
+    results = []
+    for point in points:
+        results.append(run_point(point))
+
+    # Append the run to the history file
+    record = OrderedDict([
+        ('time', time.strftime('%Y-%m-%d %H:%M:%S')),
+        ('host', platform.node()),
+        ('python', platform.python_version()),
+        ('points', results)])
+    runs = []
+    if os.path.exists(history):
+        with open(history) as fh:
+            runs = json.load(fh, object_pairs_hook=OrderedDict)
+    runs.append(record)
+    with open(history, 'w') as fh:
+        json.dump(runs, fh, indent=2)
+    return record
+
+def run_point(point):
+
+    # Each point builds in a fresh process, which may start its own workers
+    queue = Queue()
+    proc = Process(target=benchmark_point, args=(point, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    if result.has_key('error'):
+        raise Exception('Benchmark point failed - ' + result['error'])
+    return result
+
+def benchmark_point(point, queue):
+    try:
+        queue.put(time_point(point))
+    except Exception as error:
+        queue.put({'error':repr(error)})
+
+def time_point(point):
+
+    # Worker side, make_assembly is first imported here so every point starts
+    # from pristine globals
+    import make_assembly
+    if point['n_water'] != None:
+        make_assembly.n_water = point['n_water']
+    if point.has_key('core_size'):
+        n = point['core_size']
+        make_assembly.core_map = [[core_types[(i + j) % len(core_types)] for j in range(n)] for i in range(n)]
+
+    # Stage timers, entity counters and file sizes come from the build
+    # statistics, which also cover the workers of full core builds
+    make_assembly.enable_stats()
+
+    # Build and write the deck into a scratch directory
+    path = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        with make_assembly.stage('build_model'):
+            make_assembly.build_model()
+        with make_assembly.stage('write_openmc_input'):
+            make_assembly.write_openmc_input(force=True, path=path)
+        wall = time.time() - start
+        report = make_assembly.finish_stats()
+    finally:
+        shutil.rmtree(path)
+
+    # Peak resident set size in kB, including build workers
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    result = OrderedDict(point)
+    result.update({'n_water':make_assembly.n_water})
+    result.update({'wall_time':wall})
+    result.update({'stages':OrderedDict([(name, item['time']) for name, item in report['stages'].iteritems()])})
+    result.update({'counts':report['counts']})
+    result.update({'peak_rss_kb':rss})
+    result.update({'output_bytes':report['bytes']})
+    result.update({'files':report['files']})
+    return result
+
+def display_record(record):
+    print '\n{0:>8} {1:>10} {2:>10} {3:>12} {4:>12}'.format('n_water', 'assemblies', 'wall [s]', 'peak RSS [MB]', 'output [MB]')
+    for item in record['points']:
+        print '{0:>8} {1:>10} {2:10.3f} {3:12.1f} {4:12.2f}'.format(item['n_water'], item['assemblies'], item['wall_time'],
+                                                                 item['peak_rss_kb']/1024.0, item['output_bytes']/1048576.0)
+    for item in record['points']:
+        print '\nn_water {0}, {1} assemblies'.format(item['n_water'], item['assemblies'])
+        for stage, value in item['stages'].iteritems():
+            if value > 0.0:
+                print '  {0:<24} {1:10.3f} s'.format(stage, value)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python2
+
+# Packages
+import sys
+import numpy as np
+from geometry import *
+from check_geometry import universe_placements, sample_claims
+
+# Sampling options
+n_points = 20000 # points sampled per universe
+seed = 1
+
+def main():
+
+    # Build the model in build order and show the order the cells would get
+    import make_assembly
+    make_assembly.cell_order_points = None
+    make_assembly.build_model()
+    points = n_points
+    if len(sys.argv) > 1:
+        points = int(sys.argv[1])
+    report = order_cells(points)
+    display_order(report)
+
+def order_cells(points=n_points):
+
+    # OpenMC searches the cells of a universe in the order they are listed,
+    # so each universe's cells are sorted by the fraction of its sampled
+    # points they hold. Ties keep the build order, which puts cells that
+    # were never hit (thin spacers) last. Sampling can miss a thin overlap,
+    # so only a universe whose cells are all proven disjoint is reordered,
+    # any other one may depend on its first match and keeps its order.
+    geometry = Geometry()
+    placements = universe_placements(geometry)
+    report = []
+    order = {}
+    for universe, cells in geometry.universes.iteritems():
+        if not placements.has_key(universe) or len(cells) < 2:
+            continue
+        x, y, z, claims = sample_claims(geometry, universe, placements[universe], points, seed)
+        ids = [cell[0] for cell in cells]
+        hits = claims.sum(axis=0)
+        overlaps = np.count_nonzero(claims.sum(axis=1) > 1)
+        disjoint = all_disjoint(geometry, [cell[1] for cell in cells])
+        if disjoint:
+            rank = sorted(range(len(ids)), key=lambda i: -hits[i])
+            order.update({universe:[ids[i] for i in rank]})
+        report.append(OrderedDict([
+            ('universe', universe),
+            ('samples', len(x)),
+            ('overlaps', overlaps),
+            ('disjoint', disjoint),
+            ('cells', ids),
+            ('fractions', (hits/float(max(len(x), 1))).tolist()),
+            ('order', order.get(universe, ids))]))
+    apply_order(order)
+    return report
+
+def all_disjoint(geometry, regions):
+
+    # Every pair of regions has a pair of half-spaces that cannot meet
+    terms = [geometry.terms(region) for region in regions]
+    if None in terms:
+        return False
+    for i in range(len(terms)):
+        for j in range(i + 1, len(terms)):
+            if not any([separated(geometry, a, b) for a in terms[i] for b in terms[j]]):
+                return False
+    return True
+
+# Coordinates across the axis of each cylinder type
+cylinder_axes = {'x-cylinder':'yz', 'y-cylinder':'xz', 'z-cylinder':'xy'}
+
+def separated(geometry, a, b):
+
+    # Two half-spaces that do not intersect: the two sides of one surface,
+    # the inside of a cylinder and a plane side clear of it, or the inside
+    # of a surface and the outside of a parallel plane or concentric
+    # cylinder that lies beyond it
+    for inside, side in ((a, b), (b, a)):
+        type_c, c = geometry.surfaces[inside[1]]
+        type_p, p = geometry.surfaces[side[1]]
+        if cylinder_axes.has_key(type_c) and not inside[2] and type_p in ('x-plane', 'y-plane', 'z-plane'):
+            k = cylinder_axes[type_c].find(type_p[0])
+            if k < 0:
+                return False
+            if side[2]:
+                return p[0] >= c[k] + c[2]
+            return p[0] < c[k] - c[2]
+    if a[2] == b[2]:
+        return False
+    if not a[2]:
+        a, b = b, a
+    if a[1] == b[1]:
+        return True
+    type_a, c_a = geometry.surfaces[a[1]]
+    type_b, c_b = geometry.surfaces[b[1]]
+    if type_a != type_b:
+        return False
+    if type_a in ('x-plane', 'y-plane', 'z-plane'):
+        return c_b[0] <= c_a[0]
+    if type_a == 'plane':
+        return np.array_equal(c_a[:3], c_b[:3]) and c_b[3] <= c_a[3]
+    if type_a in ('x-cylinder', 'y-cylinder', 'z-cylinder'):
+        return np.array_equal(c_a[:2], c_b[:2]) and c_b[2] <= c_a[2]
+    return False
+
+def apply_order(order):
+
+    # A reordered universe's cells take the registry slots its cells had,
+    # so cells of different universes stay where they were
+    keys = dict([(cell.id, key) for key, cell in cell_dict.iteritems()])
+    queues = dict([(universe, [keys[id] for id in ids]) for universe, ids in order.iteritems()])
+    items = []
+    for key, cell in cell_dict.items():
+        if queues.has_key(cell.universe):
+            key = queues[cell.universe].pop(0)
+        items.append((key, cell_dict[key]))
+    for key, cell in items:
+        del cell_dict[key]
+    cell_dict.update(items)
+
+    # Universes list their cells by current registry key in the new order
+    for univ in unique_values(univ_dict):
+        if order.has_key(univ.id):
+            univ.cells = [keys[id] for id in order[univ.id]]
+
+def display_order(report):
+    for item in report:
+        moved = item['order'] != item['cells']
+        print '\nUniverse {0}: {1} points{2}{3}{4}'.format(item['universe'], item['samples'],
+                                                           ', {0} overlapping points'.format(item['overlaps']) if item['overlaps'] > 0 else '',
+                                                           ', cells not proven disjoint keep their order' if not item['disjoint'] else '',
+                                                           ', reordered' if moved else '')
+        fractions = dict(zip(item['cells'], item['fractions']))
+        for cell_id in item['order']:
+            print '  cell {0:>8} {1:8.4f}'.format(cell_id, fractions[cell_id])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python2
+
+# Packages
+import sys
+import numpy as np
+from multiprocessing import Pool
+from geometry import *
+
+# Sampling options
+n_points = 100000 # points sampled per universe
+seed = 1
+max_report = 10   # points listed per universe and kind of error
+n_procs = None    # worker processes, None uses all cores
+
+# Geometry and universe placements shared with the forked workers
+_geometry = None
+_placements = None
+
+def main():
+
+    # Build the model and check every universe
+    import make_assembly
+    make_assembly.build_model()
+    points = n_points
+    if len(sys.argv) > 1:
+        points = int(sys.argv[1])
+    report = check_geometry(points)
+    display_report(report)
+    if any([item['holes'] > 0 or item['overlaps'] > 0 for item in report]):
+        sys.exit(1)
+
+def check_geometry(points=n_points, procs=n_procs):
+
+    # Compile the geometry once, the workers inherit it when they fork
+    global _geometry, _placements
+    _geometry = Geometry()
+    _placements = universe_placements(_geometry)
+    jobs = [(universe, points) for universe in _geometry.universes.keys() if _placements.has_key(universe)]
+    pool = Pool(procs)
+    try:
+        report = pool.map(check_universe, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return report
+
+def universe_placements(geometry):
+
+    # Local boxes each universe is seen through, walked down from the root.
+    # A lattice element exposes its pitch box, a cell fill exposes the
+    # cell's region (and the box of its planes) in the same coordinates.
+    # The root is seen through the model boundary.
+    placements = OrderedDict()
+    lower, upper = geometry.box()
+    if not np.all(np.isfinite(lower)) or not np.all(np.isfinite(upper)):
+        raise Exception('Root universe is not bounded by x, y and z planes')
+    stack = [(0, lower, upper, boundary_region(geometry))]
+    seen = set()
+    while len(stack) > 0:
+        universe, lower, upper, region = stack.pop()
+        key = (universe, tuple(lower), tuple(upper), None if region == None else region.text)
+        if key in seen:
+            continue
+        seen.add(key)
+        placements.setdefault(universe, [])
+        placements[universe].append((lower, upper, region))
+
+        for cell_id, region, fill, material in geometry.universes.get(universe, []):
+            if fill == None:
+                continue
+            lo, hi = geometry.bounds(region)
+            lo = np.maximum(lo, lower)
+            hi = np.minimum(hi, upper)
+            if np.any(hi <= lo):
+                continue
+            if geometry.lattices.has_key(fill):
+                lleft, width, univs = geometry.lattices[fill]
+                for child in np.unique(univs):
+                    stack.append((int(child), np.array([-0.5*width[0], -0.5*width[1], lo[2]]),
+                                  np.array([0.5*width[0], 0.5*width[1], hi[2]]), None))
+            else:
+                stack.append((fill, lo, hi, region))
+    return placements
+
+def boundary_region(geometry):
+
+    # Half-spaces of the root cells on surfaces with a boundary condition,
+    # e.g. the diagonal plane of an eighth assembly inside its bounding box
+    bc_ids = set([surf.id for surf in unique_values(surf_dict) if surf.bc != None])
+    tokens = []
+    for cell_id, region, fill, material in geometry.universes[0]:
+        for node in geometry.terms(region) or []:
+            token = '{0}{1}'.format('' if node[2] else '-', node[1])
+            if node[1] in bc_ids and token not in tokens:
+                tokens.append(token)
+    if len(tokens) == 0:
+        return None
+    return Region(' '.join(tokens))
+
+def sample_claims(geometry, universe, places, points, seed=seed):
+
+    # Sample the union of the universe's placements and tell which cells
+    # claim each point that lies inside one of them
+    lower = np.min([place[0] for place in places], axis=0)
+    upper = np.max([place[1] for place in places], axis=0)
+    rng = np.random.RandomState(seed + universe)
+    xyz = lower + (upper - lower)*rng.random_sample((points, 3))
+    x, y, z = xyz[:,0], xyz[:,1], xyz[:,2]
+
+    inside = np.zeros(points, dtype=bool)
+    for lo, hi, region in places:
+        mask = np.all((xyz >= lo) & (xyz <= hi), axis=1)
+        if region != None:
+            mask &= region.contains(geometry, x, y, z)
+        inside |= mask
+    x, y, z = x[inside], y[inside], z[inside]
+
+    claims = np.zeros((len(x), len(geometry.universes[universe])), dtype=bool)
+    for i, (cell_id, region, fill, material) in enumerate(geometry.universes[universe]):
+        claims[:,i] = region.contains(geometry, x, y, z)
+    return x, y, z, claims
+
+def check_universe(job):
+
+    # Worker side, count the cells claiming each sampled point
+    universe, points = job
+    x, y, z, claims = sample_claims(_geometry, universe, _placements[universe], points)
+    n_claims = claims.sum(axis=1)
+    cell_ids = np.array([cell[0] for cell in _geometry.universes[universe]])
+
+    holes = np.nonzero(n_claims == 0)[0]
+    overlaps = np.nonzero(n_claims > 1)[0]
+    return OrderedDict([
+        ('universe', universe),
+        ('samples', len(x)),
+        ('holes', len(holes)),
+        ('overlaps', len(overlaps)),
+        ('hole_points', [(x[i], y[i], z[i]) for i in holes[:max_report]]),
+        ('overlap_points', [(x[i], y[i], z[i], cell_ids[claims[i]].tolist()) for i in overlaps[:max_report]])])
+
+def display_report(report):
+    bad = 0
+    for item in report:
+        if item['holes'] == 0 and item['overlaps'] == 0:
+            continue
+        bad += 1
+        print '\nUniverse {0}: {1} of {2} points undefined, {3} overlapping'.format(
+            item['universe'], item['holes'], item['samples'], item['overlaps'])
+        for point in item['hole_points']:
+            print '  undefined at ({0:.5f}, {1:.5f}, {2:.5f})'.format(*point)
+        for point in item['overlap_points']:
+            print '  overlap at ({0:.5f}, {1:.5f}, {2:.5f}) cells {3}'.format(*point)
+    print '\n{0} universes checked, {1} with errors'.format(len(report), bad)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python2
+
+# Packages
+import re
+import numpy as np
+from assembly import *
+
+# Region tokens: signed surface IDs, union, complement and parentheses
+region_token = re.compile(r'[-+]?\d+|[|~()]')
+
+# Class Definitions
+class Region(object):
+
+    # Half-space expression of a cell. Juxtaposition is intersection, "|" is
+    # union and "~" the complement of the following term, as in OpenMC.
+    # Nodes are ('and', [nodes]), ('or', [nodes]), ('not', node) and
+    # ('surf', id, positive).
+    def __init__(self, surfaces):
+        self.text = surfaces
+        tokens = region_token.findall(surfaces)
+        if len(tokens) == 0:
+            self.tree = None
+        else:
+            self.tree, pos = self.parse_union(tokens, 0)
+            if pos != len(tokens):
+                raise Exception('Could not parse region - ' + surfaces)
+
+    def parse_union(self, tokens, pos):
+        terms = []
+        node, pos = self.parse_intersection(tokens, pos)
+        terms.append(node)
+        while pos < len(tokens) and tokens[pos] == '|':
+            node, pos = self.parse_intersection(tokens, pos + 1)
+            terms.append(node)
+        if len(terms) == 1:
+            return terms[0], pos
+        return ('or', terms), pos
+
+    def parse_intersection(self, tokens, pos):
+        terms = []
+        while pos < len(tokens) and tokens[pos] not in ('|', ')'):
+            node, pos = self.parse_term(tokens, pos)
+            terms.append(node)
+        if len(terms) == 0:
+            raise Exception('Empty term in region - ' + self.text)
+        if len(terms) == 1:
+            return terms[0], pos
+        return ('and', terms), pos
+
+    def parse_term(self, tokens, pos):
+        token = tokens[pos]
+        if token == '~':
+            node, pos = self.parse_term(tokens, pos + 1)
+            return ('not', node), pos
+        if token == '(':
+            node, pos = self.parse_union(tokens, pos + 1)
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise Exception('Unbalanced parentheses in region - ' + self.text)
+            return node, pos + 1
+        value = int(token)
+        return ('surf', abs(value), not token.startswith('-')), pos + 1
+
+    def surfaces(self, node=None):
+        # IDs of all surfaces the region refers to
+        if node == None:
+            node = self.tree
+        if node == None:
+            return []
+        if node[0] == 'surf':
+            return [node[1]]
+        if node[0] == 'not':
+            return self.surfaces(node[1])
+        ids = []
+        for item in node[1]:
+            ids += self.surfaces(item)
+        return ids
+
+    def contains(self, geometry, x, y, z, node=None):
+        # Boolean mask of the points inside the region
+        if node == None:
+            node = self.tree
+            if node == None:
+                return np.ones(len(x), dtype=bool)
+        if node[0] == 'surf':
+            f = geometry.evaluate(node[1], x, y, z)
+            if node[2]:
+                return f > 0.0
+            return f <= 0.0
+        if node[0] == 'not':
+            return ~self.contains(geometry, x, y, z, node[1])
+        mask = self.contains(geometry, x, y, z, node[1][0])
+        for item in node[1][1:]:
+            if node[0] == 'and':
+                mask &= self.contains(geometry, x, y, z, item)
+            else:
+                mask |= self.contains(geometry, x, y, z, item)
+        return mask
+
+class Geometry(object):
+
+    # Compiled snapshot of the active model's CSG tree that classifies arrays
+    # of points by walking universe fills and lattices in vectorized form
+    def __init__(self):
+
+        # Surfaces by ID
+        self.surfaces = {}
+        for surf in unique_values(surf_dict):
+            self.surfaces.update({surf.id:(surf.type, np.array([float(c) for c in surf.coeffs.split()]))})
+
+        # Cells of each universe in the order OpenMC searches them
+        self.cells = {}
+        self.universes = OrderedDict()
+        for cell in cell_dict.itervalues():
+            self.cells.update({cell.id:cell})
+            self.universes.setdefault(cell.universe, [])
+            self.universes[cell.universe].append((cell.id, Region(cell.surfaces), cell.fill, cell.material))
+
+        # Lattices with the universe rows flipped so row 0 is the bottom
+        self.lattices = {}
+        for lat in lat_dict.itervalues():
+            univs = lat.universes[::-1].astype(int)
+            self.lattices.update({lat.id:(np.array([float(v) for v in lat.lower_left.split()]),
+                                          np.array([float(v) for v in lat.width.split()]), univs)})
+
+    def evaluate(self, surf_id, x, y, z):
+        # Surface function, positive on the positive side of the surface
+        type, c = self.surfaces[surf_id]
+        if type == 'x-plane':
+            return x - c[0]
+        if type == 'y-plane':
+            return y - c[0]
+        if type == 'z-plane':
+            return z - c[0]
+        if type == 'plane':
+            return c[0]*x + c[1]*y + c[2]*z - c[3]
+        if type == 'z-cylinder':
+            return (x - c[0])**2 + (y - c[1])**2 - c[2]**2
+        if type == 'y-cylinder':
+            return (x - c[0])**2 + (z - c[1])**2 - c[2]**2
+        if type == 'x-cylinder':
+            return (y - c[0])**2 + (z - c[1])**2 - c[2]**2
+        if type == 'sphere':
+            return (x - c[0])**2 + (y - c[1])**2 + (z - c[2])**2 - c[3]**2
+        raise Exception('Surface type not supported - ' + type)
+
+    def terms(self, region):
+        # Half-spaces of a region that is a plain intersection, None otherwise
+        if region.tree == None:
+            return []
+        if region.tree[0] == 'surf':
+            return [region.tree]
+        if region.tree[0] == 'and' and all([node[0] == 'surf' for node in region.tree[1]]):
+            return region.tree[1]
+        return None
+
+    def bounds(self, region):
+        # Lower and upper corner of the box cut out by the region's x, y and z
+        # planes, infinite along unbounded directions
+        lower = np.empty(3)
+        upper = np.empty(3)
+        lower.fill(-np.inf)
+        upper.fill(np.inf)
+        terms = self.terms(region)
+        if terms == None:
+            return lower, upper
+        for node in terms:
+            type, c = self.surfaces[node[1]]
+            if type in ('x-plane', 'y-plane', 'z-plane'):
+                axis = 'xyz'.index(type[0])
+                if node[2]:
+                    lower[axis] = max(lower[axis], c[0])
+                else:
+                    upper[axis] = min(upper[axis], c[0])
+        return lower, upper
+
+    def box(self, universe=0):
+        # Box enclosing all cells of a universe, the core box for the root
+        lower = np.empty(3)
+        upper = np.empty(3)
+        lower.fill(np.inf)
+        upper.fill(-np.inf)
+        for cell_id, region, fill, material in self.universes[universe]:
+            lo, hi = self.bounds(region)
+            lower = np.minimum(lower, lo)
+            upper = np.maximum(upper, hi)
+        return lower, upper
+
+    def find(self, x, y, z, universe=0, chunk=1 << 20):
+        # Material and cell ID at each point, -1 where no cell claims it. The
+        # cell is the deepest one, i.e. the cell holding the material.
+        x, y, z = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float),
+                                      np.asarray(z, dtype=float))
+        shape = x.shape
+        x, y, z = x.ravel(), y.ravel(), z.ravel()
+        mat = np.empty(len(x), dtype=int)
+        cell = np.empty(len(x), dtype=int)
+        mat.fill(-1)
+        cell.fill(-1)
+        for start in range(0, len(x), chunk):
+            idx = np.arange(start, min(start + chunk, len(x)))
+            self.locate(universe, x[idx], y[idx], z[idx], idx, mat, cell)
+        return mat.reshape(shape), cell.reshape(shape)
+
+    def locate(self, universe, x, y, z, idx, mat, cell):
+        # First cell of the universe that contains each point wins
+        remaining = np.arange(len(idx))
+        for cell_id, region, fill, material in self.universes.get(universe, []):
+            if len(remaining) == 0:
+                break
+            hit = region.contains(self, x[remaining], y[remaining], z[remaining])
+            sel = remaining[hit]
+            remaining = remaining[~hit]
+            if len(sel) == 0:
+                continue
+            if fill == None:
+                mat[idx[sel]] = material
+                cell[idx[sel]] = cell_id
+            elif self.lattices.has_key(fill):
+                self.locate_lattice(fill, x[sel], y[sel], z[sel], idx[sel], mat, cell)
+            else:
+                self.locate(fill, x[sel], y[sel], z[sel], idx[sel], mat, cell)
+
+    def locate_lattice(self, lattice, x, y, z, idx, mat, cell):
+        # Points outside of the lattice stay unclaimed
+        lleft, width, univs = self.lattices[lattice]
+        i = np.floor((x - lleft[0])/width[0]).astype(int)
+        j = np.floor((y - lleft[1])/width[1]).astype(int)
+        inside = (i >= 0) & (i < univs.shape[1]) & (j >= 0) & (j < univs.shape[0])
+        x, y, z, idx, i, j = x[inside], y[inside], z[inside], idx[inside], i[inside], j[inside]
+
+        # Local coordinates are relative to the lattice element center
+        x = x - (lleft[0] + (i + 0.5)*width[0])
+        y = y - (lleft[1] + (j + 0.5)*width[1])
+        fills = univs[j, i]
+        for universe in np.unique(fills):
+            sel = fills == universe
+            self.locate(int(universe), x[sel], y[sel], z[sel], idx[sel], mat, cell)
+
+def find_material(x, y, z):
+    # Material ID at each point of the active model, -1 outside all cells
+    return Geometry().find(x, y, z)[0]
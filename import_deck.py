@@ -0,0 +1,190 @@
+#!/usr/bin/env python2
+
+# Packages
+import os
+import sys
+import numpy as np
+import xml.etree.cElementTree as ET
+from assembly import *
+
+# Bytes handed to the XML parser at a time
+read_size = 1 << 20
+
+def main():
+
+    # python import_deck.py deck_dir [output_dir], re-emits the imported deck
+    import make_assembly
+    path = sys.argv[1]
+    out = path
+    if len(sys.argv) > 2:
+        out = sys.argv[2]
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    import_deck(path)
+    files = [name for name in ('geometry.xml', 'materials.xml', 'plots.xml') if os.path.exists(os.path.join(path, name))]
+    make_assembly.write_openmc_input(True, out, files)
+
+class DeckTarget(object):
+
+    # Parser target that turns elements into registry items as they close,
+    # so no element tree of the deck is ever held in memory. Surface and
+    # cell comments follow their element, all other comments precede it.
+    def __init__(self):
+        self.text = []
+        self.attrib = None
+        self.last = None
+        self.comment_before = None
+        self.item = None
+        self.fields = {}
+        self.materials = None
+
+    def start(self, tag, attrib):
+        self.text = []
+        if tag in ('surface', 'cell'):
+            self.comment_before = None
+        elif tag in ('lattice', 'material', 'plot'):
+            self.last = None
+            self.fields = {}
+            self.item = (tag, attrib, self.comment_before)
+            self.comment_before = None
+        elif tag in ('element', 'nuclide', 'sab', 'col_spec'):
+            self.fields.setdefault(tag, [])
+            self.fields[tag].append(attrib)
+        else:
+            self.last = None
+        if tag in ('surface', 'cell'):
+            self.attrib = attrib
+
+    def data(self, data):
+        self.text.append(data)
+        if '\n' in data:
+            self.last = None
+
+    def comment(self, text):
+        comment = text.strip()
+        if self.last != None:
+            self.last.comment = intern_str(comment)
+            self.last = None
+        else:
+            self.comment_before = comment
+
+    def end(self, tag):
+        text = ''.join(self.text)
+        self.text = []
+        if tag == 'surface':
+            self.last = import_surface(self.attrib)
+        elif tag == 'cell':
+            self.last = import_cell(self.attrib)
+        elif tag in ('lattice', 'material', 'plot'):
+            tag, attrib, comment = self.item
+            if tag == 'lattice':
+                import_lattice(attrib, self.fields, comment)
+            elif tag == 'material':
+                import_material(attrib, self.fields, comment)
+            else:
+                if self.materials == None:
+                    self.materials = dict([(item.id, item) for item in mat_dict.itervalues()])
+                import_plot(attrib, self.fields, comment, self.materials)
+            self.item = None
+        elif self.item != None and tag not in ('element', 'nuclide', 'sab', 'col_spec'):
+            self.fields.update({tag:text})
+
+    def close(self):
+        return None
+
+def parse_file(filename):
+    # Feed the file in blocks through a streaming parser
+    parser = ET.XMLParser(target=DeckTarget())
+    with open(filename) as fh:
+        while True:
+            block = fh.read(read_size)
+            if block == '':
+                break
+            parser.feed(block)
+    parser.close()
+
+def import_deck(path='.'):
+
+    # Rebuild the registries of the active model from a deck with the
+    # original IDs. Items are keyed by type and ID, e.g. surface_12, since
+    # the deck does not carry the generator's keys. Materials go first so
+    # that plot colors can be attached to them.
+    for name in ('materials.xml', 'geometry.xml', 'plots.xml'):
+        if os.path.exists(os.path.join(path, name)):
+            parse_file(os.path.join(path, name))
+
+    # Universes from the cells that belong to them
+    for key, cell in cell_dict.iteritems():
+        if cell.universe == 0:
+            univ_key = 'global'
+        else:
+            univ_key = 'universe_{0}'.format(cell.universe)
+        if not univ_dict.has_key(univ_key):
+            univ_dict.update({univ_key:Universe(cell.universe)})
+        univ_dict[univ_key].add_cell(key)
+
+    # New items are numbered after the imported ones
+    model = active_model()
+    model.n_surfaces = max([item.id for item in surf_dict.itervalues()] + [0])
+    model.n_cells = max([item.id for item in cell_dict.itervalues()] + [0])
+    model.n_materials = max([item.id for item in mat_dict.itervalues()] + [0])
+    model.n_universes = max([item.id for item in univ_dict.itervalues()] +
+                            [item.id for item in lat_dict.itervalues()] + [0])
+    model.n_lattices = len(lat_dict)
+    model.n_plots = max([item.id for item in plot_dict.itervalues()] + [0])
+
+def import_surface(attrib):
+    id = int(attrib['id'])
+    key = 'surface_{0}'.format(id)
+    surf = new(Surface, id=id, type=intern_str(attrib['type'].strip()), coeffs=attrib['coeffs'].strip(),
+               bc=intern_str(attrib.get('boundary')), comment=None)
+    surf_dict.update({key:surf})
+    index_surface(key)
+    return surf
+
+def import_cell(attrib):
+    id = int(attrib['id'])
+    fill = attrib.get('fill')
+    material = attrib.get('material')
+    cell = new(Cell, id=id, universe=int(attrib.get('universe', '0')),
+               fill=None if fill == None else int(fill), material=None if material == None else int(material),
+               surfaces=intern_str(attrib.get('region', attrib.get('surfaces', '')).strip()), comment=None)
+    cell_dict.update({'cell_{0}'.format(id):cell})
+    return cell
+
+def import_lattice(attrib, fields, comment):
+    id = int(attrib['id'])
+    dimension = intern_str(attrib['dimension'])
+    nx, ny = dimension.split()
+    lat = new(Lattice, id=id, type=intern_str(attrib.get('type', 'rectangular')), dimension=dimension,
+              lower_left=intern_str(fields['lower_left']), width=intern_str(fields['width']),
+              universes=np.array(fields['universes'].split(), dtype=np.int32).reshape(int(ny), int(nx)),
+              comment=intern_str(comment), nx=nx, ny=ny)
+    lat_dict.update({'lattice_{0}'.format(id):lat})
+
+def import_material(attrib, fields, comment):
+    id = int(attrib['id'])
+    key = 'material_{0}'.format(id)
+    mat = new(Material, id=id, key=intern_str(key), comment=intern_str(comment), color=None,
+              elements=[Element(item['name'], item['xs'], item['ao']) for item in fields.get('element', [])],
+              nuclides=[Nuclide(item['name'], item['xs'], item['ao']) for item in fields.get('nuclide', [])],
+              sab=None)
+    if fields.has_key('sab'):
+        mat.sab = Sab(fields['sab'][0]['name'], fields['sab'][0]['xs'])
+    mat_dict.update({key:mat})
+
+def import_plot(attrib, fields, comment, materials):
+    id = int(attrib['id'])
+    plot = new(Plot, id=id, type=attrib.get('type', 'slice'), color=attrib.get('color', 'cell'),
+               filename=fields['filename'], origin=fields['origin'].strip(), width=fields['width'].strip(),
+               basis=fields['basis'].strip(), pixels=fields['pixels'], background=fields['background'],
+               comment=comment)
+    plot_dict.update({'plot_{0}'.format(id):plot})
+
+    # Plot colors are material colors
+    for item in fields.get('col_spec', []):
+        if materials.has_key(int(item['id'])):
+            materials[int(item['id'])].color = intern_str(item['rgb'])
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,11 @@
 
 from assembly import *
 import numpy as np
+import os
+import json
 from collections import OrderedDict
+from multiprocessing import Pool
+from cell_order import order_cells
 
 # Input Data
 settings = {
@@ -14,9 +18,11 @@ settings = {
 n_densities = 1 # number of unique densities from hzp to 0.66
 n_temps = 1  # number of unique fuel temperature linear from 600 to 1200
 n_water = 25 # number of water materials, cmfd regions
+assembly_power = 17.674e6 # power of one full assembly
+assembly_flowrate = 88.5145 # coolant flow rate of one full assembly
 cmfd = {
-'power' : 17.674e6,
-'flowrate' : 88.5145,
+'power' : assembly_power, # power and flow rate of the modeled geometry, set by create_cmfd
+'flowrate' : assembly_flowrate,
 'inlet_enthalpy' : 1301740.,
 'n_assemblies': 1,
 'boron' : 975,
@@ -28,6 +34,41 @@ cmfd = {
 'feedback':'false'
 }
 
+# Full core map of assembly types (rows listed north to south), entries are
+# keys of assembly_types or None for a water position. None builds a single
+# assembly with reflective boundaries.
+core_map = None
+assembly_types = {
+'1.6' : {'fuel':'fuel16', 'enr':1.6, 'bp':False},
+'2.4' : {'fuel':'fuel24', 'enr':2.4, 'bp':False},
+'2.4bp' : {'fuel':'fuel24', 'enr':2.4, 'bp':True},
+'3.1' : {'fuel':'fuel31', 'enr':3.1, 'bp':False},
+'3.1bp' : {'fuel':'fuel31', 'enr':3.1, 'bp':True}
+}
+n_bp_rods = 12 # burnable absorber rods in an assembly with bp
+deck_hash_file = 'deck_hashes.json' # section hashes stored next to the deck
+water_cache_size = 128 # water compositions remembered by thermodynamic state
+n_procs = None     # worker processes for full core builds, None uses all cores
+id_stride = 100000 # IDs reserved for each assembly type in a full core
+stats_file = None  # write build statistics as JSON, e.g. 'build_stats.json'
+cell_order_points = None # points sampled per universe to order its cells, e.g. 20000, None keeps build order
+grid_regions = False # grid spacers and strap moderator as single union/complement region cells
+
+# Symmetry of a single assembly model: None for the full assembly, 'quarter'
+# or 'eighth' cut it at the centerlines (and the diagonal) with reflective
+# planes. Fractions of the assembly that are modeled.
+symmetry = None
+symmetry_fraction = {None:1.0, 'quarter':0.25, 'eighth':0.125}
+
+# Model sections each deck file is written from
+deck_sections = OrderedDict([
+('geometry.xml', ('surfaces', 'cells', 'lattices')),
+('materials.xml', ('materials',)),
+('settings.xml', ('settings',)),
+('plots.xml', ('plots', 'materials')),
+('cmfd.xml', ('cmfd',))
+])
+
 # Global data
 hzp_density = 0.73986            # Highest density
 low_density = 0.66               # Lowest density
@@ -97,38 +138,156 @@ axial_labels = [
 
 def main():
 
+    # Collect build statistics if requested and not already collecting
+    if stats_file != None and active_model().stats == None:
+        enable_stats()
+
+    # Build the model
+    with stage('build_model'):
+        build_model()
+
+    # Write OpenMC files
+    with stage('write_openmc_input'):
+        write_openmc_input()
+
+    # Report build statistics
+    report = finish_stats()
+    if stats_file != None:
+        with open(stats_file, 'w') as fh:
+            json.dump(report, fh, indent=2)
+
+def build_model():
+    if not symmetry_fraction.has_key(symmetry):
+        raise Exception('Symmetry not recognized - {0}'.format(symmetry))
+
+    # Full core decks are built per assembly type
+    if core_map != None:
+        if symmetry != None:
+            raise Exception('Symmetry is only supported for single assembly models')
+        build_core()
+    else:
+
+        # Make assembly
+        build_assembly()
+
+        # Create core
+        with stage('create_core'):
+            create_core()
+
+        # Create cmfd
+        with stage('create_cmfd'):
+            create_cmfd()
+
+    # Most frequently hit cells first in each universe
+    if cell_order_points != None:
+        with stage('order_cells'):
+            order_cells(cell_order_points)
+
+def build_core():
+
+    # Build each distinct assembly type in its own worker process, giving
+    # every type a separate block of IDs so the decks merge without collisions
+    types = sorted(set([item for row in core_map for item in row if item != None]))
+    stats = active_model().stats
+    jobs = [(key, (i + 1)*id_stride, stats != None) for i, key in enumerate(types)]
+    with stage('build_assembly_types'):
+        pool = Pool(n_procs, maxtasksperchild=1)
+        try:
+            results = pool.map(build_assembly_type, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    # Merge the assembly types, worker stage times add up over the types
+    with stage('merge_assembly'):
+        for key, result in zip(types, results):
+            merge_assembly(key, result)
+            if stats != None:
+                stats.merge(result['stats'])
+
+    # Create core
+    with stage('create_full_core'):
+        create_full_core(types[0])
+
+    # Create cmfd, the single assembly maps are replaced by per position maps
+    with stage('create_cmfd'):
+        create_cmfd(prefix = types[0]+':')
+        create_full_core_cmfd()
+
+def build_assembly(fuel_key='fuel24', bp=True):
+
     # Create all static materials
-    create_static_materials()
+    with stage('create_static_materials'):
+        create_static_materials()
+        if not mat_dict.has_key(fuel_key):
+            create_fuel_material(fuel_key)
 
     # Create surfaces
-    create_surfaces()
+    with stage('create_surfaces'):
+        create_surfaces()
 
     # Create grid info
-    create_gridstrap()
+    with stage('create_gridstrap'):
+        create_gridstrap()
 
     # Create static pins
-    create_fuelpin()
-    create_bppin()
-    create_bppinDP()
-    create_gtpin()
-    create_gtpinDP()
-    create_fuelplenumpin()
-    create_bpplenumpin()
+    with stage('create_pins'):
+        create_fuelpin(fuel_key)
+        create_bppin()
+        create_bppinDP()
+        create_gtpin()
+        create_gtpinDP()
+        create_fuelplenumpin()
+        create_bpplenumpin()
 
     # Create axial regions
-    create_axial_regions()
+    with stage('create_axial_regions'):
+        create_axial_regions()
 
     # Make assembly
-    create_assembly()
-
-    # Create core
-    create_core()
-
-    # Create cmfd
-    create_cmfd()
-
-    # Write OpenMC files
-    write_openmc_input()
+    with stage('create_assembly'):
+        create_assembly(bp)
+
+    # Merge equivalent neighbouring axial cells
+    with stage('coalesce_cells'):
+        coalesce_cells('assembly')
+
+def build_assembly_type(job):
+
+    # Worker side of build_core, runs in a fresh process
+    key, offset, collect = job
+    with Model(offset) as model:
+        if collect:
+            enable_stats()
+        build_assembly(assembly_types[key]['fuel'], assembly_types[key]['bp'])
+    if model.max_id() >= offset + id_stride:
+        raise Exception('Assembly type {0} overflows its ID block, increase id_stride'.format(key))
+    return {'surfaces':model.surf_dict, 'cells':model.cell_dict, 'materials':model.mat_dict,
+            'universes':model.univ_dict, 'lattices':model.lat_dict, 'axial':model.axial_dict,
+            'stats':model.stats}
+
+def merge_assembly(type_key, result):
+
+    # Copy a worker's entities in under type-prefixed keys; boundary surfaces
+    # belong to the single assembly box and are left out. The assembly plots
+    # are not copied, create_full_core adds plots of the whole core.
+    prefix = type_key + ':'
+    for key, item in result['surfaces'].iteritems():
+        if item.bc == None:
+            surf_dict.update({prefix+key:item})
+    for key, item in result['cells'].iteritems():
+        cell_dict.update({prefix+key:item})
+    for key, item in result['materials'].iteritems():
+        mat_dict.update({prefix+key:item})
+    for key, item in result['universes'].iteritems():
+        univ_dict.update({prefix+key:item})
+    for key, item in result['lattices'].iteritems():
+        lat_dict.update({prefix+key:item})
+    if len(axial_dict) == 0:
+        for key, item in result['axial'].iteritems():
+            item.bottom = prefix + item.bottom
+            item.top = prefix + item.top
+            axial_dict.update({prefix+key:item})
 
 def create_static_materials():
 
@@ -314,13 +473,20 @@ def create_surfaces():
     add_surface('core_bottom', 'z-plane', '{0}'.format(axial_surfaces['lowest_extent']), 'vacuum', 'Core bottom surface')
     add_surface('core_top', 'z-plane', '{0}'.format(axial_surfaces['highest_extent']), 'vacuum', 'Core top surface')
 
-def create_fuelpin():
+    # Symmetry planes through the assembly center
+    if symmetry != None:
+        add_surface('core_x0', 'x-plane', '0.0', 'reflective', 'Core x symmetry plane')
+        add_surface('core_y0', 'y-plane', '0.0', 'reflective', 'Core y symmetry plane')
+    if symmetry == 'eighth':
+        add_surface('core_diag', 'plane', '1.0 -1.0 0.0 0.0', 'reflective', 'Core diagonal symmetry plane')
+
+def create_fuelpin(fuel_key='fuel24'):
 
     # Fuel Pellet
     add_cell('fuel', 
         surfaces = '-{0}'.format(surf_dict['fuelOR'].id), 
         universe = 'fuel',
-        material = mat_dict['fuel24'].id,
+        material = mat_dict[fuel_key].id,
         comment = 'Fuel pellet')
 
     # Gas Gap
@@ -532,60 +698,8 @@ def create_fuelpin_cell(cell_key, pin_key, water_key, grid = None):
         fill = univ_dict[pin_key].id,
         comment = 'Fuel pin fill for coolant')
 
-    if grid != None:
-
-        # Allow this to work with TB and I grids
-        gridleft = 'grid'+grid+'left'
-        gridright = 'grid'+grid+'right'
-        gridback = 'grid'+grid+'back'
-        gridfront = 'grid'+grid+'front'
-
-        # Determine grid spacer material
-        if grid == 'TB':
-            gridmat = 'in'
-        elif grid == 'I':
-            gridmat = 'zr'
-        else:
-            raise Exception('Grid type not recognized - ' + grid)
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict['cladOR'].id, surf_dict[gridleft].id, surf_dict[gridright].id,
-                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around fuel pin before grid ' + grid)
-
-        # Fill in grid (requires 4 cells because OpenMC doesn't have union operator)
-        add_cell('gridtbn_'+cell_key,
-            surfaces = '{0} {1} -{2}'.format(surf_dict[gridfront].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer N')
-        add_cell('gridtbs_'+cell_key,
-            surfaces = '-{0} {1} -{2}'.format(surf_dict[gridback].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer S')
-        add_cell('gridtbe_'+cell_key,
-            surfaces = '{0}'.format(surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer NE/E/SE')
-        add_cell('gridtbw_'+cell_key,
-            surfaces = '-{0}'.format(surf_dict[gridleft].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer SW/W/NW')
-
-    else:
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0}'.format(surf_dict['cladOR'].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around fuel pin')
+    # Coolant and grid spacer around the pin
+    create_coolant_cells(cell_key, 'cladOR', water_key, 'fuel pin', grid)
 
 def create_bppin_cell(cell_key, pin_key, water_key, grid = None):
 
@@ -596,60 +710,8 @@ def create_bppin_cell(cell_key, pin_key, water_key, grid = None):
         fill = univ_dict[pin_key].id,
         comment = 'BP pin fill for coolant')
 
-    if grid != None:
-
-        # Allow this to work with TB and I grids
-        gridleft = 'grid'+grid+'left'
-        gridright = 'grid'+grid+'right'
-        gridback = 'grid'+grid+'back'
-        gridfront = 'grid'+grid+'front'
-
-        # Determine grid spacer material
-        if grid == 'TB':
-            gridmat = 'in'
-        elif grid == 'I':
-            gridmat = 'zr'
-        else:
-            raise Exception('Grid type not recognized - ' + grid)
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict['gtOR'].id, surf_dict[gridleft].id, surf_dict[gridright].id,
-                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around BP pin before grid ' + grid)
-
-        # Fill in grid (requires 4 cells because OpenMC doesn't have union operator)
-        add_cell('gridtbn_'+cell_key,
-            surfaces = '{0} {1} -{2}'.format(surf_dict[gridfront].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer N')
-        add_cell('gridtbs_'+cell_key,
-            surfaces = '-{0} {1} -{2}'.format(surf_dict[gridback].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer S')
-        add_cell('gridtbe_'+cell_key,
-            surfaces = '{0}'.format(surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer NE/E/SE')
-        add_cell('gridtbw_'+cell_key,
-            surfaces = '-{0}'.format(surf_dict[gridleft].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer SW/W/NW')
-
-    else:
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0}'.format(surf_dict['gtOR'].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around BP pin')
+    # Coolant and grid spacer around the pin
+    create_coolant_cells(cell_key, 'gtOR', water_key, 'BP pin', grid)
 
 def create_bppinDP_cell(cell_key, pin_key, water_key, grid = None):
 
@@ -660,60 +722,8 @@ def create_bppinDP_cell(cell_key, pin_key, water_key, grid = None):
         fill = univ_dict[pin_key].id,
         comment = 'BP pin fill for coolant at DP')
 
-    if grid != None:
-
-        # Allow this to work with TB and I grids
-        gridleft = 'grid'+grid+'left'
-        gridright = 'grid'+grid+'right'
-        gridback = 'grid'+grid+'back'
-        gridfront = 'grid'+grid+'front'
-
-        # Determine grid spacer material
-        if grid == 'TB':
-            gridmat = 'in'
-        elif grid == 'I':
-            gridmat = 'zr'
-        else:
-            raise Exception('Grid type not recognized - ' + grid)
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict['gtORdp'].id, surf_dict[gridleft].id, surf_dict[gridright].id,
-                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around BP pin at DP before grid ' + grid)
-
-        # Fill in grid (requires 4 cells because OpenMC doesn't have union operator)
-        add_cell('gridtbn_'+cell_key,
-            surfaces = '{0} {1} -{2}'.format(surf_dict[gridfront].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer N')
-        add_cell('gridtbs_'+cell_key,
-            surfaces = '-{0} {1} -{2}'.format(surf_dict[gridback].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer S')
-        add_cell('gridtbe_'+cell_key,
-            surfaces = '{0}'.format(surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer NE/E/SE')
-        add_cell('gridtbw_'+cell_key,
-            surfaces = '-{0}'.format(surf_dict[gridleft].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer SW/W/NW')
-
-    else:
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0}'.format(surf_dict['gtORdp'].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around BP pin at DP')
+    # Coolant and grid spacer around the pin
+    create_coolant_cells(cell_key, 'gtORdp', water_key, 'BP pin at DP', grid)
 
 def create_gtpin_cell(cell_key, pin_key, water_key, grid = None):
 
@@ -724,60 +734,8 @@ def create_gtpin_cell(cell_key, pin_key, water_key, grid = None):
         fill = univ_dict[pin_key].id, 
         comment = 'GT pin fill for coolant')
 
-    if grid != None:
-
-        # Allow this to work with TB and I grids
-        gridleft = 'grid'+grid+'left'
-        gridright = 'grid'+grid+'right'
-        gridback = 'grid'+grid+'back'
-        gridfront = 'grid'+grid+'front'
-
-        # Determine grid spacer material
-        if grid == 'TB':
-            gridmat = 'in'
-        elif grid == 'I':
-            gridmat = 'zr'
-        else:
-            raise Exception('Grid type not recognized - ' + grid)
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict['gtOR'].id, surf_dict[gridleft].id, surf_dict[gridright].id,
-                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around GT pin before grid ' + grid)
-
-        # Fill in grid (requires 4 cells because OpenMC doesn't have union operator)
-        add_cell('gridtbn_'+cell_key,
-            surfaces = '{0} {1} -{2}'.format(surf_dict[gridfront].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer N')
-        add_cell('gridtbs_'+cell_key,
-            surfaces = '-{0} {1} -{2}'.format(surf_dict[gridback].id, surf_dict[gridleft].id, surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer S')
-        add_cell('gridtbe_'+cell_key,
-            surfaces = '{0}'.format(surf_dict[gridright].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer NE/E/SE')
-        add_cell('gridtbw_'+cell_key,
-            surfaces = '-{0}'.format(surf_dict[gridleft].id),
-            universe = cell_key,
-            material = mat_dict[gridmat].id,
-            comment = grid + ' Grid Spacer SW/W/NW')
-
-    else:
-
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0}'.format(surf_dict['gtOR'].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around GT pin')
+    # Coolant and grid spacer around the pin
+    create_coolant_cells(cell_key, 'gtOR', water_key, 'GT pin', grid)
 
 def create_gtpinDP_cell(cell_key, pin_key, water_key, grid = None):
 
@@ -788,6 +746,11 @@ def create_gtpinDP_cell(cell_key, pin_key, water_key, grid = None):
         fill = univ_dict[pin_key].id,
         comment = 'GT pin fill for coolant at DP')
 
+    # Coolant and grid spacer around the pin
+    create_coolant_cells(cell_key, 'gtORdp', water_key, 'GT pin at DP', grid)
+
+def create_coolant_cells(cell_key, pin_surf, water_key, pin_name, grid = None):
+
     if grid != None:
 
         # Allow this to work with TB and I grids
@@ -796,14 +759,6 @@ def create_gtpinDP_cell(cell_key, pin_key, water_key, grid = None):
         gridback = 'grid'+grid+'back'
         gridfront = 'grid'+grid+'front'
 
-        # Fill in water coolant
-        add_cell('cool_'+cell_key,
-            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict['gtORdp'].id, surf_dict[gridleft].id, surf_dict[gridright].id,
-                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
-            universe = cell_key,
-            material = mat_dict[water_key].id,
-            comment = 'Coolant around GT pin at DP before grid ' + grid)
-
         # Determine grid spacer material
         if grid == 'TB':
             gridmat = 'in'
@@ -812,7 +767,26 @@ def create_gtpinDP_cell(cell_key, pin_key, water_key, grid = None):
         else:
             raise Exception('Grid type not recognized - ' + grid)
 
-        # Fill in grid (requires 4 cells because OpenMC doesn't have union operator)
+        # Fill in water coolant
+        add_cell('cool_'+cell_key,
+            surfaces = '{0} {1} -{2} {3} -{4}'.format(surf_dict[pin_surf].id, surf_dict[gridleft].id, surf_dict[gridright].id,
+                                                      surf_dict[gridback].id, surf_dict[gridfront].id),
+            universe = cell_key,
+            material = mat_dict[water_key].id,
+            comment = 'Coolant around ' + pin_name + ' before grid ' + grid)
+
+        # Fill in grid, one cell outside of the spacer box with region
+        # operators
+        if grid_regions:
+            add_cell('gridtb_'+cell_key,
+                surfaces = '~({0} -{1} {2} -{3})'.format(surf_dict[gridleft].id, surf_dict[gridright].id,
+                                                         surf_dict[gridback].id, surf_dict[gridfront].id),
+                universe = cell_key,
+                material = mat_dict[gridmat].id,
+                comment = grid + ' Grid Spacer')
+            return
+
+        # Fill in grid (requires 4 cells without union operator)
         add_cell('gridtbn_'+cell_key,
             surfaces = '{0} {1} -{2}'.format(surf_dict[gridfront].id, surf_dict[gridleft].id, surf_dict[gridright].id),
             universe = cell_key,
@@ -838,10 +812,10 @@ def create_gtpinDP_cell(cell_key, pin_key, water_key, grid = None):
 
         # Fill in water coolant
         add_cell('cool_'+cell_key,
-            surfaces = '{0}'.format(surf_dict['gtORdp'].id),
+            surfaces = '{0}'.format(surf_dict[pin_surf].id),
             universe = cell_key,
             material = mat_dict[water_key].id,
-            comment = 'Coolant around GT pin at DP')
+            comment = 'Coolant around ' + pin_name)
 
 def create_gridstrap():
 
@@ -867,11 +841,15 @@ def create_gridstrap():
 
     # Northeast grid strap
     for gridmat in ['ss', 'zr']:
+        strap = '-{0} -{1}'.format(surf_dict['strapright'].id, surf_dict['strapfront'].id)
         add_cell('strap_NE_'+gridmat,
-            surfaces = '-{0} -{1}'.format(surf_dict['strapright'].id, surf_dict['strapfront'].id),
+            surfaces = strap,
             universe = 'strap_NE_'+gridmat,
             material = mat_dict[gridmat].id,
             comment = 'Northeast {0} grid strap'.format(gridmat))
+        if grid_regions:
+            create_strap_mod('NE', strap, gridmat, 'northeast')
+            continue
         add_cell('strap_NE_mod_n_'+gridmat,
             surfaces = '-{0} {1}'.format(surf_dict['strapright'].id, surf_dict['strapfront'].id),
             universe = 'strap_NE_'+gridmat,
@@ -903,11 +881,15 @@ def create_gridstrap():
 
     # Southeast grid strap
     for gridmat in ['ss', 'zr']:
+        strap = '-{0} {1}'.format(surf_dict['strapright'].id, surf_dict['strapback'].id)
         add_cell('strap_SE_'+gridmat,
-            surfaces = '-{0} {1}'.format(surf_dict['strapright'].id, surf_dict['strapback'].id),
+            surfaces = strap,
             universe = 'strap_SE_'+gridmat,
             material = mat_dict[gridmat].id,
             comment = 'Southeast {0} grid strap'.format(gridmat))
+        if grid_regions:
+            create_strap_mod('SE', strap, gridmat, 'southeast')
+            continue
         add_cell('strap_SE_mod_s_'+gridmat,
             surfaces = '-{0} -{1}'.format(surf_dict['strapright'].id, surf_dict['strapback'].id),
             universe = 'strap_SE_'+gridmat,
@@ -939,11 +921,15 @@ def create_gridstrap():
 
     # Southwest grid strap
     for gridmat in ['ss', 'zr']:
+        strap = '{0} {1}'.format(surf_dict['strapleft'].id, surf_dict['strapback'].id)
         add_cell('strap_SW_'+gridmat,
-            surfaces = '{0} {1}'.format(surf_dict['strapleft'].id, surf_dict['strapback'].id),
+            surfaces = strap,
             universe = 'strap_SW_'+gridmat,
             material = mat_dict[gridmat].id,
             comment = 'Southwest {0} grid strap'.format(gridmat))
+        if grid_regions:
+            create_strap_mod('SW', strap, gridmat, 'southwest')
+            continue
         add_cell('strap_SW_mod_s_'+gridmat,
             surfaces = '{0} -{1}'.format(surf_dict['strapleft'].id, surf_dict['strapback'].id),
             universe = 'strap_SW_'+gridmat,
@@ -975,11 +961,15 @@ def create_gridstrap():
 
     # Northwest grid strap
     for gridmat in ['ss', 'zr']:
+        strap = '{0} -{1}'.format(surf_dict['strapleft'].id, surf_dict['strapfront'].id)
         add_cell('strap_NW_'+gridmat,
-            surfaces = '{0} -{1}'.format(surf_dict['strapleft'].id, surf_dict['strapfront'].id),
+            surfaces = strap,
             universe = 'strap_NW_'+gridmat,
             material = mat_dict[gridmat].id,
             comment = 'Northwest {0} grid strap'.format(gridmat))
+        if grid_regions:
+            create_strap_mod('NW', strap, gridmat, 'northwest')
+            continue
         add_cell('strap_NW_mod_s_'+gridmat,
             surfaces = '{0} {1}'.format(surf_dict['strapleft'].id, surf_dict['strapfront'].id),
             universe = 'strap_NW_'+gridmat,
@@ -996,13 +986,22 @@ def create_gridstrap():
             material = mat_dict['h2o_hzp'].id,
             comment = 'Mod northwest of {0} northest grid strap'.format(gridmat))
 
+def create_strap_mod(corner, strap, gridmat, name):
+
+    # Moderator around a corner strap as the complement of the strap
+    add_cell('strap_{0}_mod_{1}'.format(corner, gridmat),
+        surfaces = '~({0})'.format(strap),
+        universe = 'strap_{0}_{1}'.format(corner, gridmat),
+        material = mat_dict['h2o_hzp'].id,
+        comment = 'Mod around {0} {1} grid strap'.format(gridmat, name))
+
 def create_lattice(lat_key, fuel_key, bp_key, gt_key, it_key, grid=False, comment = None):
 
-    # Get ids
-    fuel_id = univ_dict[fuel_key].id
-    bp_id = univ_dict[bp_key].id
-    gt_id = univ_dict[gt_key].id
-    it_id = univ_dict[it_key].id
+    # Get ids, folding pin universes that duplicate an existing one
+    fuel_id = collapse_universe(fuel_key)
+    bp_id = collapse_universe(bp_key)
+    gt_id = collapse_universe(gt_key)
+    it_id = collapse_universe(it_key)
 
     # Check for grid
     if grid == 'TB':
@@ -1037,46 +1036,71 @@ def create_lattice(lat_key, fuel_key, bp_key, gt_key, it_key, grid=False, commen
     # Calculate coordinates
     lleft = -19.0*pin_pitch / 2.0
 
-    # Make lattice
-    add_lattice(lat_key,
-        dimension = '19 19',
-        lower_left = '{0} {0}'.format(lleft),
-        width = '{0} {0}'.format(pin_pitch),
-        universes = { 'fp': fuel_id,
-                      'pa': bp_id,
-                      'pb': gt_id,
-                      'pc': bp_id,
-                      'pd': bp_id,
-                      'pe': bp_id,
-                      'pf': bp_id,
-                      'pg': gt_id,
-                      'ph': gt_id,
-                      'pi': gt_id,
-                      'pj': bp_id,
-                      'pk': gt_id,
-                      'pl': gt_id,
-                      'pm': it_id,
-                      'pn': gt_id,
-                      'po': gt_id,
-                      'pp': bp_id,
-                      'pq': gt_id,
-                      'pr': gt_id,
-                      'ps': gt_id,
-                      'pt': bp_id,
-                      'pu': bp_id,
-                      'pv': bp_id,
-                      'pw': bp_id,
-                      'px': gt_id,
-                      'py': bp_id,
-                      'no': no_id,
-                      'ne': ne_id,
-                      'ea': ea_id,
-                      'se': se_id,
-                      'so': so_id,
-                      'sw': sw_id,
-                      'we': we_id,
-                      'nw': nw_id},
-        comment = comment)
+    # Universe of each template position
+    universes = { 'fp': fuel_id,
+                  'pa': bp_id,
+                  'pb': gt_id,
+                  'pc': bp_id,
+                  'pd': bp_id,
+                  'pe': bp_id,
+                  'pf': bp_id,
+                  'pg': gt_id,
+                  'ph': gt_id,
+                  'pi': gt_id,
+                  'pj': bp_id,
+                  'pk': gt_id,
+                  'pl': gt_id,
+                  'pm': it_id,
+                  'pn': gt_id,
+                  'po': gt_id,
+                  'pp': bp_id,
+                  'pq': gt_id,
+                  'pr': gt_id,
+                  'ps': gt_id,
+                  'pt': bp_id,
+                  'pu': bp_id,
+                  'pv': bp_id,
+                  'pw': bp_id,
+                  'px': gt_id,
+                  'py': bp_id,
+                  'no': no_id,
+                  'ne': ne_id,
+                  'ea': ea_id,
+                  'se': se_id,
+                  'so': so_id,
+                  'sw': sw_id,
+                  'we': we_id,
+                  'nw': nw_id}
+
+    # Make lattice, symmetric models keep the quadrant north-east of the
+    # center element
+    if symmetry == None:
+        add_lattice(lat_key,
+            dimension = '19 19',
+            lower_left = '{0} {0}'.format(lleft),
+            width = '{0} {0}'.format(pin_pitch),
+            universes = universes,
+            comment = comment)
+    else:
+        add_lattice(lat_key,
+            dimension = '10 10',
+            lower_left = '{0} {0}'.format(-pin_pitch/2.0),
+            width = '{0} {0}'.format(pin_pitch),
+            universes = quadrant(universes),
+            comment = comment)
+
+def quadrant(universes):
+
+    # North-east quadrant of the pin lattice including the center row and
+    # column. The pin pattern inside the grid straps must have the symmetry
+    # of the model for the cut to be exact.
+    layout = np.array([[universes[key] for key in row] for row in pin_layout])
+    pins = layout[1:-1,1:-1]
+    if not np.all(pins == pins[::-1]) or not np.all(pins == pins[:,::-1]):
+        raise Exception('Lattice is not quarter symmetric')
+    if symmetry == 'eighth' and not np.all(pins == pins.T):
+        raise Exception('Lattice is not eighth symmetric')
+    return layout[:10,9:]
 
 def create_axial_regions():
 
@@ -1110,19 +1134,11 @@ def create_axial_regions():
     create_gtpinDP_cell('gtDP_hzp', 'gtDP', 'h2o_hzp')
     create_lattice('bottom_fuel', 'botfpin', 'gtDP_hzp', 'gtDP_hzp', 'gt_hzp', comment = 'Bottom of Fuel Rod')
 
-    # Compute water region thickness
+    # Water planes split the active fuel into n_water equal regions
+    baf = axial_surfaces['baf']
+    taf = axial_surfaces['taf']
     water_size = active_core_height/float(n_water)
-
-    # Determine where water planes are
-    more = True
-    water_planes = []
-    current_plane = axial_surfaces['baf']
-    while(more):
-        current_plane += water_size
-        water_planes.append(current_plane)
-        if current_plane + water_size > axial_surfaces['taf']:
-            more = False
-    water_planes.append(axial_surfaces['taf'])
+    water_planes = np.append(baf + water_size*np.arange(1, n_water), taf)
 
     # Set up function for water density calculation
     try:
@@ -1134,81 +1150,62 @@ def create_axial_regions():
     # Add lower core surfaces
     add_surface('lower_plenum', 'z-plane', '{0}'.format(axial_surfaces['lower_plenum']), comment = 'Bottom Support Plate')
     add_surface('support_plate', 'z-plane', '{0}'.format(axial_surfaces['support_plate']), comment = 'Top Support Plate')
-
-    # Begin loop from BAF to TAF
-    add_surface('baf', 'z-plane', '{0}'.format(axial_surfaces['baf']), comment = 'Bottom of Active Fuel')
-    bottom_surface = ['baf']
-    top_surface = []
-    grids = []
-    label_idx = 0
-    water_idx = 0
-    grid = False
-    grid_id = 0
-    for plane in OrderedDict(sorted(axial_surfaces.items(), key=lambda t: t[1])):
-
-        # start above baf
-        if axial_surfaces[plane] <= axial_surfaces['baf']:
-            continue
-
-        # stop after taf
-        if axial_surfaces[plane] > axial_surfaces['taf']:
-            break
-
-        # check for grid
-        if grid:
-            grids.append(grid_id)
+    add_surface('baf', 'z-plane', '{0}'.format(baf), comment = 'Bottom of Active Fuel')
+
+    # Structural planes above BAF up to TAF, labelled in height order
+    names = sorted(axial_surfaces.keys(), key=lambda key: axial_surfaces[key])
+    labels = dict(zip(names, axial_labels))
+    names = [key for key in names if axial_surfaces[key] > baf and axial_surfaces[key] <= taf]
+    struct = np.array([axial_surfaces[key] for key in names])
+
+    # Region boundaries are the merged structural and water planes. A water
+    # plane is named after the structural plane above it.
+    planes = np.union1d(struct, water_planes)
+    above = np.searchsorted(struct, planes)
+    is_struct = struct[above] == planes
+    keys = ['baf']
+    labels.update({'baf':'Bottom of Active Fuel'})
+    subplane = 0
+    for z, idx, structural in zip(planes, above, is_struct):
+        plane = names[idx]
+        if structural:
+            key = plane
+            subplane = 0
         else:
-            grids.append(0)
-        if 'grid' in plane and 'bot' in plane:
-            grid = True
-            grid_id += 1
-        elif 'grid' in plane and 'top' in plane:
-            grid = False
-
-        # check if we hit a water plane first
-        label = axial_labels[label_idx]
-        subplane = 1
-        while water_planes[water_idx] < axial_surfaces[plane]:
-            axial_labels.insert(label_idx,label + ' Water Region {0}'.format(subplane))
-            add_surface(plane+'_water {0}'.format(subplane), 'z-plane', '{0}'.format(water_planes[water_idx]), comment = axial_labels[label_idx])
-            bottom_surface.append(plane+'_water {0}'.format(subplane))
-            top_surface.append(plane+'_water {0}'.format(subplane))
-            axial_surfaces.update({plane+'_water {0}'.format(subplane):water_planes[water_idx]})
-            label_idx += 1
-            water_idx += 1
             subplane += 1
-            grids.append(grid)
-            if water_idx >= len(water_planes):
-                break
-
-        # add surface
-        add_surface(plane, 'z-plane', '{0}'.format(axial_surfaces[plane]), comment = axial_labels[label_idx])
-        bottom_surface.append(plane)
-        top_surface.append(plane)
-        label_idx += 1
-    del bottom_surface[len(bottom_surface)-1] # delete the last entry
-
-    # Loop around axial regions
-    water_idx = 0
-    for i in range(len(bottom_surface)):
-        bottom = bottom_surface[i]
-        top = top_surface[i]
-        if axial_surfaces[top] <= axial_surfaces['dptop']:
-            dp = True
-        else:
-            dp = False
-        grid = grids[i]
-        add_axial('{0}_{1}'.format(axial_labels[i+3], axial_labels[i+4]),
-            bottom = bottom,
-            top = top,
-            dp = dp,
-            grid = grid,
-            water_idx = water_idx,
-            cool_rho = coolant_density(water_idx))
-        if water_planes[water_idx] == axial_surfaces[top]:
-            water_idx += 1
-
-def create_assembly():
+            key = plane+'_water {0}'.format(subplane)
+            labels.update({key:labels[plane] + ' Water Region {0}'.format(subplane)})
+        add_surface(key, 'z-plane', '{0}'.format(z), comment = labels[key])
+        keys.append(key)
+
+    # Grid, dashpot and water region of each region from its bottom plane
+    bottoms = np.append(baf, planes[:-1])
+    grid_ids = sorted([int(key[4:-3]) for key in axial_surfaces.keys() if key.startswith('grid') and key.endswith('bot')])
+    grid_bots = np.array([axial_surfaces['grid{0}bot'.format(n)] for n in grid_ids])
+    grid_tops = np.array([axial_surfaces['grid{0}top'.format(n)] for n in grid_ids])
+    in_grid = np.searchsorted(grid_bots, bottoms, side='right') - 1
+    grids = np.where((in_grid >= 0) & (bottoms < grid_tops[in_grid]), np.array(grid_ids)[in_grid], 0)
+    dps = planes <= axial_surfaces['dptop']
+    water_idx = np.searchsorted(water_planes, bottoms, side='right')
+
+    # Heights of the region planes for the assembly builder
+    active_model().cache('plane_heights').update(zip(keys, np.append(baf, planes)))
+
+    # Axial regions
+    for i in range(len(planes)):
+        add_axial('{0}_{1}'.format(labels[keys[i]], labels[keys[i+1]]),
+            bottom = keys[i],
+            top = keys[i+1],
+            dp = bool(dps[i]),
+            grid = int(grids[i]),
+            water_idx = int(water_idx[i]),
+            cool_rho = coolant_density(water_idx[i]))
+
+def plane_height(key):
+    # Height of an axial region plane, water planes are not in axial_surfaces
+    return float(active_model().cache('plane_heights')[key])
+
+def create_assembly(bp=True):
 
     # Add lower plenum region 
     add_cell('lower_plenum',
@@ -1249,26 +1246,21 @@ def create_assembly():
     # Build active core
     i = 0
     current_water = -1
+
+    # Create the water materials of all axial regions in one batch
+    water = OrderedDict()
+    for axial in axial_dict.itervalues():
+        water.setdefault(axial.water_idx, axial.cool_rho)
+    rho = np.array(water.values())
+    color = -156.0/(hzp_density - low_density) * (rho - hzp_density) # Color for plots
+    create_water_materials(['water_{0}'.format(idx) for idx in water.keys()], rho, colors = color,
+                           cache = cmfd['feedback'] != 'true') # feedback needs a material per region
+
     for item in axial_dict.keys():
 
         # Get the current axial region
         axial = axial_dict[item]
-
-        # Create water material for this axial region
-        #     if not yet created
-        grid_counter = 0
-        if current_water != axial.water_idx:
-
-            # Color for plots
-            color = -156.0/(hzp_density - low_density) * \
-                    (axial.cool_rho - hzp_density)
-
-            # Water material
-            create_water_material('water_{0}'.format(axial.water_idx),
-                                  axial.cool_rho, color)
-
-            # Make this the current water index
-            current_water = axial.water_idx
+        current_water = axial.water_idx
 
         # Check for grid
         if axial.grid > 0:
@@ -1287,7 +1279,7 @@ def create_assembly():
             create_gtpin_cell('gtw_{0}'.format(i), 'gt', 'water_{0}'.format(current_water), grid=grid)
 
         # Check to create bp pin
-        if axial_surfaces[axial.bottom] >= axial_surfaces['bpbot']:
+        if bp and plane_height(axial.bottom) >= axial_surfaces['bpbot']:
             if axial.dp:
                 create_bppinDP_cell('bpw_{0}'.format(i), 'bpDP', 'water_{0}'.format(current_water), grid=grid)
             else:
@@ -1314,7 +1306,7 @@ def create_assembly():
 
         # Add a plot
         add_plot('plot_active_region_{0}'.format(i),
-            origin = '0.0 0.0 {0}'.format(0.5*(axial_surfaces[axial.bottom] + axial_surfaces[axial.top])),
+            origin = '0.0 0.0 {0}'.format(0.5*(plane_height(axial.bottom) + plane_height(axial.top))),
             width = '{0} {0}'.format(assy_pitch+5),
             basis = 'xy',
             filename = 'active_region_{0}'.format(i))
@@ -1323,8 +1315,12 @@ def create_assembly():
     i -= 1
     # Add pin plenum region before grid 8
     create_fuelpin_cell('fuelpinplenum', 'fuelplenum', 'water_{0}'.format(current_water))
-    create_bppin_cell('bppinplenum', 'bpplenum', 'water_{0}'.format(current_water))
-    create_lattice('pinplenum', 'fuelpinplenum', 'bppinplenum', 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Pin Plenum before Grid 8')
+    if bp:
+        create_bppin_cell('bppinplenum', 'bpplenum', 'water_{0}'.format(current_water))
+        bp_key = 'bppinplenum'
+    else:
+        bp_key = 'gtw_{0}'.format(i)
+    create_lattice('pinplenum', 'fuelpinplenum', bp_key, 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Pin Plenum before Grid 8')
     add_surface('grid8bot', 'z-plane', '{0}'.format(axial_surfaces['grid8bot']), comment = 'Grid 8 Bottom')
     add_cell('pinplenum',
         surfaces = '{0} -{1}'.format(surf_dict['taf'].id, surf_dict['grid8bot'].id),
@@ -1339,9 +1335,10 @@ def create_assembly():
 
     # Add Grid 8 region
     create_fuelpin_cell('fuelpinplenumgrid8', 'fuelplenum', 'water_{0}'.format(current_water), grid = 'TB')
-    create_bppin_cell('bppinplenumgrid8', 'bpplenum', 'water_{0}'.format(current_water), grid = 'TB')
+    if bp:
+        create_bppin_cell('bppinplenumgrid8', 'bpplenum', 'water_{0}'.format(current_water), grid = 'TB')
     create_gtpin_cell('gtpinplenumgrid8', 'gt', 'water_{0}'.format(current_water), grid = 'TB')
-    create_lattice('pinplenumgrid8', 'fuelpinplenumgrid8', 'bppinplenumgrid8', 'gtpinplenumgrid8', 'gtpinplenumgrid8', grid = 'TB', comment = 'Pin Plenum at Grid 8')
+    create_lattice('pinplenumgrid8', 'fuelpinplenumgrid8', 'bppinplenumgrid8' if bp else 'gtpinplenumgrid8', 'gtpinplenumgrid8', 'gtpinplenumgrid8', grid = 'TB', comment = 'Pin Plenum at Grid 8')
     add_surface('grid8top', 'z-plane', '{0}'.format(axial_surfaces['grid8top']), comment = 'Grid 8 Top')
     add_cell('pinplenumgrid8',
         surfaces = '{0} -{1}'.format(surf_dict['grid8bot'].id, surf_dict['grid8top'].id),
@@ -1378,7 +1375,7 @@ def create_assembly():
         universe = 'topplug',
         material = mat_dict['water_{0}'.format(current_water)].id,
         comment = 'Coolant around Fuel Top Plug')
-    create_lattice('topplug', 'topplug', 'bppinplenum', 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Fuel Top Plug')
+    create_lattice('topplug', 'topplug', bp_key, 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Fuel Top Plug')
     add_surface('rodtop', 'z-plane', '{0}'.format(axial_surfaces['rodtop']), comment = 'Top of Fuel Rod')
     add_cell('rodtopplug', 
         surfaces = '{0} -{1}'.format(surf_dict['topplugbot'].id, surf_dict['rodtop'].id),
@@ -1397,7 +1394,7 @@ def create_assembly():
         universe = 'upperwater',
         material = mat_dict['water_{0}'.format(current_water)].id,
         comment = 'Coolant in before nozzle')
-    create_lattice('beforenozzle', 'upperwater', 'bppinplenum', 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Before Nozzle')
+    create_lattice('beforenozzle', 'upperwater', bp_key, 'gtw_{0}'.format(i), 'gtw_{0}'.format(i), comment = 'Before Nozzle')
     add_surface('nozzlebot', 'z-plane', '{0}'.format(axial_surfaces['nozzlebot']), comment = 'Bottom of Nozzle')
     add_cell('beforenozzle', 
         surfaces = '{0} -{1}'.format(surf_dict['rodtop'].id, surf_dict['nozzlebot'].id),
@@ -1424,18 +1421,22 @@ def create_assembly():
         comment = 'Coolant around fuel pin in nozzle')
 
     # BP Pin
-    add_cell('bp_nozzle_ss',
-        surfaces = '-{0}'.format(surf_dict['bpIR6'].id),
-        universe = 'bp_nozzle',
-        material = mat_dict['ss'].id,
-        comment = 'SS BP Pin to approximate Nozzle')
-    add_cell('bp_nozzle_cool',
-        surfaces = '{0}'.format(surf_dict['bpIR6'].id),
-        universe = 'bp_nozzle',
-        material = mat_dict['water_{0}'.format(current_water)].id,
-        comment = 'Coolant around bp pin in nozzle')
+    if bp:
+        add_cell('bp_nozzle_ss',
+            surfaces = '-{0}'.format(surf_dict['bpIR6'].id),
+            universe = 'bp_nozzle',
+            material = mat_dict['ss'].id,
+            comment = 'SS BP Pin to approximate Nozzle')
+        add_cell('bp_nozzle_cool',
+            surfaces = '{0}'.format(surf_dict['bpIR6'].id),
+            universe = 'bp_nozzle',
+            material = mat_dict['water_{0}'.format(current_water)].id,
+            comment = 'Coolant around bp pin in nozzle')
+        bp_key = 'bp_nozzle'
+    else:
+        bp_key = 'upperwater'
 
-    create_lattice('nozzle', 'fuel_nozzle', 'bp_nozzle', 'upperwater', 'upperwater', comment = 'Nozzle')
+    create_lattice('nozzle', 'fuel_nozzle', bp_key, 'upperwater', 'upperwater', comment = 'Nozzle')
     add_surface('nozzletop', 'z-plane', '{0}'.format(axial_surfaces['nozzletop']), comment = 'Top of Nozzle')
     add_cell('nozzle', 
         surfaces = '{0} -{1}'.format(surf_dict['nozzlebot'].id, surf_dict['nozzletop'].id),
@@ -1461,20 +1462,202 @@ def create_assembly():
         filename = 'upper_plenum')
 
 def create_core():
+
+    # Symmetric models start at the centerlines, an eighth is the quarter
+    # below the diagonal (x > y)
+    if symmetry == None:
+        radial = '{0} -{1} {2} -{3}'.format(surf_dict['core_left'].id, surf_dict['core_right'].id,
+                                            surf_dict['core_back'].id, surf_dict['core_front'].id)
+    else:
+        radial = '{0} -{1} {2} -{3}'.format(surf_dict['core_x0'].id, surf_dict['core_right'].id,
+                                            surf_dict['core_y0'].id, surf_dict['core_front'].id)
+    if symmetry == 'eighth':
+        radial += ' {0}'.format(surf_dict['core_diag'].id)
+    add_cell('core',
+        surfaces = '{0} {1} -{2}'.format(radial, surf_dict['core_bottom'].id, surf_dict['core_top'].id),
+        fill = univ_dict['assembly'].id,
+        comment = 'Core fill')
+
+    add_plot('plot_axial',
+        origin = '0.0 {0} {1}'.format(6*pin_pitch,0.5*(axial_surfaces['highest_extent'] + axial_surfaces['lowest_extent'])),
+        width = '{0} {1}'.format(assy_pitch+5, axial_surfaces['highest_extent'] - axial_surfaces['lowest_extent'] + 5),
+        basis = 'xz',
+        filename = 'axial')
+
+    # Plots of a symmetric model are centered on the quadrant it fills
+    box = assy_pitch/2.0
+    if symmetry != None:
+        for plot in plot_dict.itervalues():
+            x, y, z = plot.origin.split()
+            if plot.basis == 'xy':
+                plot.origin = '{0} {0} {1}'.format(box/2.0, z)
+                plot.width = '{0} {0}'.format(box+5)
+            elif plot.basis == 'xz':
+                plot.origin = '{0} {1} {2}'.format(box/2.0, y, z)
+                plot.width = '{0} {1}'.format(box+5, plot.width.split()[1])
+
+    # Source and entropy box, a symmetric model uses the quadrant, which is
+    # also the bounding box of an eighth
+    xbot, ybot, xtop, ytop = -box, -box, box, box
+    if symmetry != None:
+        xbot, ybot = 0.0, 0.0
+    settings.update({
+'xbot' : xbot,
+'ybot' : ybot,
+'zbot' : axial_surfaces['baf'],
+'xtop' : xtop,
+'ytop' : ytop,
+'ztop' : axial_surfaces['taf'],
+'entrX' : 1,
+'entrY' : 1,
+'entrZ' : n_water
+    })
+
+def create_full_core(ref_type):
+
+    # Core size
+    n = len(core_map)
+    box = n*assy_pitch/2.0
+
+    # Water for positions without an assembly
+    add_cell('core_water',
+        surfaces = '',
+        universe = 'core_water',
+        material = mat_dict[ref_type+':h2o_hzp'].id,
+        comment = 'Water outside assemblies')
+
+    # Lattice of assemblies
+    water_id = univ_dict['core_water'].id
+    add_lattice('core',
+        dimension = '{0} {0}'.format(n),
+        lower_left = '{0} {0}'.format(-box),
+        width = '{0} {0}'.format(assy_pitch),
+        universes = [[water_id if item == None else univ_dict[item+':assembly'].id for item in row] for row in core_map],
+        comment = 'Core lattice')
+
+    # Core surfaces
+    add_surface('core_left', 'x-plane', '{0}'.format(-box), 'vacuum', 'Core left surface')
+    add_surface('core_right', 'x-plane', '{0}'.format(box), 'vacuum', 'Core right surface')
+    add_surface('core_back', 'y-plane', '{0}'.format(-box), 'vacuum', 'Core back surface')
+    add_surface('core_front', 'y-plane', '{0}'.format(box), 'vacuum', 'Core front surface')
+    add_surface('core_bottom', 'z-plane', '{0}'.format(axial_surfaces['lowest_extent']), 'vacuum', 'Core bottom surface')
+    add_surface('core_top', 'z-plane', '{0}'.format(axial_surfaces['highest_extent']), 'vacuum', 'Core top surface')
+
     add_cell('core',
         surfaces = '{0} -{1} {2} -{3} {4} -{5}'.format(surf_dict['core_left'].id, surf_dict['core_right'].id,
                                                        surf_dict['core_back'].id, surf_dict['core_front'].id,
                                                        surf_dict['core_bottom'].id, surf_dict['core_top'].id),
-        fill = univ_dict['assembly'].id,
+        fill = lat_dict['core'].id,
         comment = 'Core fill')
 
+    add_plot('plot_core',
+        origin = '0.0 0.0 {0}'.format(0.5*(axial_surfaces['baf'] + axial_surfaces['taf'])),
+        width = '{0} {0}'.format(2*box+5),
+        basis = 'xy',
+        pixels = '3000 3000',
+        filename = 'core')
     add_plot('plot_axial',
         origin = '0.0 {0} {1}'.format(6*pin_pitch,0.5*(axial_surfaces['highest_extent'] + axial_surfaces['lowest_extent'])),
-        width = '{0} {1}'.format(assy_pitch+5, axial_surfaces['highest_extent'] - axial_surfaces['lowest_extent'] + 5),
+        width = '{0} {1}'.format(2*box+5, axial_surfaces['highest_extent'] - axial_surfaces['lowest_extent'] + 5),
         basis = 'xz',
+        pixels = '3000 1000',
         filename = 'axial')
 
-def create_water_material(key, water_density, color=None):
+    # Source and entropy box
+    settings.update({
+'xbot' : -box,
+'ybot' : -box,
+'zbot' : axial_surfaces['baf'],
+'xtop' : box,
+'ytop' : box,
+'ztop' : axial_surfaces['taf'],
+'entrX' : n,
+'entrY' : n,
+'entrZ' : n_water
+    })
+
+def create_fuel_material(key):
+
+    # UO2 compositions for the other BEAVRS enrichments
+    if key == 'fuel16':
+        mat_fuel = Material('fuel16', 'UO2 Fuel 1.6 w/o')
+        mat_fuel.add_nuclide('U-234', '71c', '3.0131e-06')
+        mat_fuel.add_nuclide('U-235', '71c', '3.7503e-04')
+        mat_fuel.add_nuclide('U-238', '71c', '2.2625e-02')
+        mat_fuel.add_nuclide('O-16', '71c', '4.5894e-02')
+        mat_fuel.add_nuclide('O-17', '71c', '1.1180e-04')
+        mat_fuel.add_color('255 255 0')
+    elif key == 'fuel31':
+        mat_fuel = Material('fuel31', 'UO2 Fuel 3.1 w/o')
+        mat_fuel.add_nuclide('U-234', '71c', '5.7987e-06')
+        mat_fuel.add_nuclide('U-235', '71c', '7.2175e-04')
+        mat_fuel.add_nuclide('U-238', '71c', '2.2253e-02')
+        mat_fuel.add_nuclide('O-16', '71c', '4.5850e-02')
+        mat_fuel.add_nuclide('O-17', '71c', '1.1169e-04')
+        mat_fuel.add_color('255 140 0')
+    else:
+        raise Exception('Fuel material not recognized - ' + key)
+    mat_fuel.finalize()
+
+def create_water_material(key, water_density, color=None, ppm=975, xs='71c', cache=True):
+
+    # Single material through the batched path
+    if color != None:
+        color = [color]
+    create_water_materials([key], [water_density], ppm, color, xs, cache)
+
+def create_water_materials(keys, water_densities, ppm=975, colors=None, xs='71c', cache=True):
+
+    # Reuse the cached material of a state that was already generated, the
+    # cache maps (density, boron ppm, library suffix) to the material with
+    # the least recently used state first. The composition only depends on
+    # these, so they are the whole key. With cache off the cache is neither
+    # read nor changed.
+    water_cache = active_model().cache('water')
+    water_densities, ppm = np.broadcast_arrays(np.asarray(water_densities, dtype=float),
+                                               np.asarray(ppm, dtype=float))
+    new = []
+    repeats = []
+    first = {}
+    for i, key in enumerate(keys):
+        state = (float(water_densities[i]), float(ppm[i]), xs)
+        mat_h2o = water_cache.get(state) if cache else None
+        if mat_h2o is not None and mat_dict.get(mat_h2o.key) is mat_h2o:
+            del water_cache[state]
+            water_cache.update({state:mat_h2o})
+            repeats.append((key, mat_h2o.key))
+        elif cache and first.has_key(state):
+            repeats.append((key, keys[first[state]]))
+        else:
+            first.setdefault(state, i)
+            new.append(i)
+
+    # Number densities of every new material in one vectorized pass
+    densities = water_number_densities(water_densities[new], ppm[new])
+
+    # Register the materials
+    for n, i in enumerate(new):
+        mat_h2o = Material(keys[i], 'HZP Water @ {0} g/cc'.format(float(water_densities[i])))
+        for name, values in densities.iteritems():
+            mat_h2o.add_nuclide(name, xs, str(float(values[n])))
+        mat_h2o.add_sab('lwtr', '15t')
+        if colors is not None:
+            mat_h2o.add_color('{0} {0} 255'.format(int(colors[i])))
+        mat_h2o.finalize()
+        if cache:
+            state = (float(water_densities[i]), float(ppm[i]), xs)
+            water_cache.pop(state, None)
+            water_cache.update({state:mat_h2o})
+            if len(water_cache) > water_cache_size:
+                water_cache.popitem(last=False)
+
+    # Repeated states share the existing material
+    for key, match in repeats:
+        if mat_dict.has_key(key):
+            raise Exception('Material not finalized because of duplicate key - '+key)
+        mat_dict.update({key:mat_dict[match]})
+
+def water_number_densities(water_density, ppm=975):
 
     # Avagadros Number
     NA = 0.60221415
@@ -1502,9 +1685,9 @@ def create_water_material(key, water_density, color=None):
     aO17 = 0.00038
     aO18 = 0.00205
 
-    # Boron info
-    ppm = 975
-    wBph2o = ppm * 10**-6
+    # Boron info, densities and ppm may be arrays
+    water_density = np.asarray(water_density, dtype=float)
+    wBph2o = np.asarray(ppm, dtype=float) * 10**-6
 
     # Molecular mass of pure water
     Mh2o = 2*MH + MO
@@ -1529,24 +1712,18 @@ def create_water_material(key, water_density, color=None):
     NO17 = aO17 * NO
     NO18 = aO18 * NO
 
-    mat_h2o = Material(key, 'HZP Water @ {0} g/cc'.format(water_density))
-    mat_h2o.add_nuclide('B-10', '71c', str(NB10))
-    mat_h2o.add_nuclide('B-11', '71c', str(NB11))
-    mat_h2o.add_nuclide('H-1', '71c', str(NH1))
-    mat_h2o.add_nuclide('H-2', '71c', str(NH2))
-    mat_h2o.add_nuclide('O-16', '71c', str(NO16))
-    mat_h2o.add_nuclide('O-17', '71c', str(NO17 + NO18))
-    mat_h2o.add_sab('lwtr', '15t')
-    if color != None:
-        mat_h2o.add_color('{0} {0} 255'.format(int(color)))
-    mat_h2o.finalize()
+    return OrderedDict([('B-10', NB10), ('B-11', NB11), ('H-1', NH1), ('H-2', NH2),
+                        ('O-16', NO16), ('O-17', NO17 + NO18)])
 
-def create_cmfd():
+def create_cmfd(prefix=''):
 
     # Put mesh info in
     dz = (axial_surfaces['taf'] - axial_surfaces['baf'])/float(n_water)
     mx = -assy_pitch/2.0
     my = -assy_pitch/2.0
+    if symmetry != None:
+        mx = 0.0
+        my = 0.0
     mz = axial_surfaces['baf'] - dz
     px = assy_pitch/2.0
     py = assy_pitch/2.0
@@ -1554,6 +1731,7 @@ def create_cmfd():
     cmfd.update({'lower_left': '{0} {1} {2}'.format(mx, my, mz)})
     cmfd.update({'upper_right':'{0} {1} {2}'.format(px, py, pz)})
     cmfd.update({'dimension':'1 1 {0}'.format(n_water + 2)})
+    cmfd.update({'albedo':'1.0 1.0 1.0 1.0 0.0 0.0'}) # reflective radial faces
     map_str = "1\n"
     for i in range(n_water):
         map_str += "2\n"
@@ -1567,7 +1745,7 @@ def create_cmfd():
         axial = axial_dict[key]
         if axial.water_idx != current_id:
             current_id = axial.water_idx
-            water_str += "{0}\n".format(mat_dict['water_{0}'.format(current_id)].id)
+            water_str += "{0}\n".format(mat_dict[prefix+'water_{0}'.format(current_id)].id)
     water_str += "0"
     cmfd.update({'water_map':water_str})
 
@@ -1610,66 +1788,184 @@ def create_cmfd():
     # Normalization
     cmfd.update({'norm':n_water})
 
-def write_openmc_input():
+    # Power and flow of the modeled geometry, a symmetric model holds a
+    # fraction of the assembly. The mesh cannot follow the diagonal, so the
+    # single radial mesh cell of an eighth spans the quadrant and only the
+    # triangle below the diagonal scores in it.
+    fraction = symmetry_fraction[symmetry]
+    cmfd.update({'power':fraction*assembly_power})
+    cmfd.update({'flowrate':fraction*assembly_flowrate})
+    cmfd.update({'n_assemblies':1})
+
+def create_full_core_cmfd():
+
+    # Widen the mesh to the core, positions without an assembly and the
+    # layers above and below the active fuel are reflector
+    n = len(core_map)
+    box = n*assy_pitch/2.0
+    dz = (axial_surfaces['taf'] - axial_surfaces['baf'])/float(n_water)
+    cmfd.update({'lower_left': '{0} {1} {2}'.format(-box, -box, axial_surfaces['baf'] - dz)})
+    cmfd.update({'upper_right':'{0} {1} {2}'.format(box, box, axial_surfaces['taf'] + dz)})
+    cmfd.update({'dimension':'{0} {0} {1}'.format(n, n_water + 2)})
+    cmfd.update({'albedo':'0.0 0.0 0.0 0.0 0.0 0.0'}) # vacuum core boundaries
+    reflector = " ".join(["1"]*n)
+    map_str = ""
+    for k in range(n_water + 2):
+        for row in reversed(core_map):
+            if k == 0 or k == n_water + 1:
+                map_str += reflector + "\n"
+            else:
+                map_str += " ".join(["1" if item == None else "2" for item in row]) + "\n"
+    cmfd.update({'map':map_str.rstrip("\n")})
+    n_assemblies = sum([item != None for row in core_map for item in row])
+    cmfd.update({'power':n_assemblies*assembly_power})
+    cmfd.update({'flowrate':n_assemblies*assembly_flowrate})
+    cmfd.update({'n_assemblies':n_assemblies})
+
+    # Water index of each axial mesh layer, the same for every assembly type
+    water_idx = []
+    for axial in axial_dict.values():
+        if len(water_idx) == 0 or axial.water_idx != water_idx[-1]:
+            water_idx.append(axial.water_idx)
+
+    # Thermal maps follow the mesh order of the map, each assembly position
+    # gets the water, enrichment and bp of its own type. Fuel temperature and
+    # density only vary axially, reflector positions take the reflector
+    # layer values.
+    temps = cmfd['fuel_temp'].split("\n")
+    densities = cmfd['density'].split("\n")
+    water_rows = []
+    enr_rows = []
+    bp_rows = []
+    temp_rows = []
+    density_rows = []
+    for k in range(n_water + 2):
+        for row in reversed(core_map):
+            water = []
+            enr = []
+            bp = []
+            temp = []
+            density = []
+            for item in row:
+                if item == None or k == 0 or k == n_water + 1:
+                    water.append("0")
+                    enr.append("0.0")
+                    bp.append("0")
+                    temp.append(temps[0])
+                    density.append(densities[0])
+                else:
+                    water.append("{0}".format(mat_dict[item+':water_{0}'.format(water_idx[k-1])].id))
+                    enr.append("{0}".format(assembly_types[item]['enr']))
+                    bp.append("{0}".format(n_bp_rods if assembly_types[item]['bp'] else 0))
+                    temp.append(temps[k])
+                    density.append(densities[k])
+            water_rows.append(" ".join(water))
+            enr_rows.append(" ".join(enr))
+            bp_rows.append(" ".join(bp))
+            temp_rows.append(" ".join(temp))
+            density_rows.append(" ".join(density))
+    cmfd.update({'water_map':"\n".join(water_rows)})
+    cmfd.update({'enr_map':"\n".join(enr_rows)})
+    cmfd.update({'bp_map':"\n".join(bp_rows)})
+    cmfd.update({'fuel_temp':"\n".join(temp_rows)})
+    cmfd.update({'density':"\n".join(density_rows)})
+
+def section_hash(section):
+    # Content hash of one model section
+    if section == 'surfaces':
+        return fingerprint(unique_values(surf_dict))
+    if section == 'cells':
+        return fingerprint(cell_dict.itervalues())
+    if section == 'lattices':
+        return fingerprint(lat_dict.itervalues())
+    if section == 'materials':
+        return fingerprint(unique_values(mat_dict))
+    if section == 'plots':
+        return fingerprint(plot_dict.itervalues())
+    if section == 'settings':
+        return fingerprint([sorted(settings.items())])
+    if section == 'cmfd':
+        return fingerprint([sorted(cmfd.items())])
+    raise Exception('Unknown model section - ' + section)
+
+def write_openmc_input(force=False, path='.', files=None):
+
+    # Only the given deck files are considered, so a partially loaded model
+    # (e.g. from a snapshot) can write just the files it has sections for
+    if files == None:
+        files = deck_sections.keys()
+    for filename in files:
+        if not deck_sections.has_key(filename):
+            raise Exception('Unknown deck file - ' + filename)
+
+    # Hash the inputs of each output section; a file is only regenerated
+    # when one of its sections changed since the hashes stored with the deck.
+    # The whole model is still built and every needed section hashed, only
+    # the file writes are skipped. The deck files themselves are not read, so
+    # a hand edited file whose sections hash the same is kept as it is unless
+    # force is set.
+    needed = set([item for filename in files for item in deck_sections[filename]])
+    old_hashes = {}
+    if os.path.exists(os.path.join(path, deck_hash_file)) and not force:
+        with open(os.path.join(path, deck_hash_file)) as fh:
+            old_hashes = json.load(fh)
+    hashes = OrderedDict()
+    for item in ('surfaces', 'cells', 'lattices', 'materials', 'plots', 'settings', 'cmfd'):
+        if item in needed:
+            hashes.update({item:section_hash(item)})
+        elif old_hashes.has_key(item):
+            hashes.update({item:old_hashes[item]})
+    def changed(filename):
+        if filename not in files:
+            return False
+        if not os.path.exists(os.path.join(path, filename)):
+            return True
+        return any([old_hashes.get(item) != hashes[item] for item in deck_sections[filename]])
 
 ############ Geometry File ##############
 
-    # Heading info
-    geo_str = ""
-    geo_str += \
-"""<?xml version="1.0" encoding="UTF-8"?>\n<geometry>\n\n"""
+    if changed('geometry.xml'):
+        with open(os.path.join(path, 'geometry.xml'), 'w', xml_buffer_size) as fh:
+
+            # Heading info
+            fh.write("""<?xml version="1.0" encoding="UTF-8"?>\n<geometry>\n\n""")
 
-    # Write out surfaces
-    for item in surf_dict.keys():
-        geo_str += surf_dict[item].write_xml()
+            # Write out surfaces
+            for item in unique_values(surf_dict):
+                item.stream_xml(fh)
 
-    # Write out cells
-    geo_str += "\n"
-    for item in cell_dict.keys():
-        geo_str += cell_dict[item].write_xml()
+            # Write out cells
+            fh.write("\n")
+            for item in cell_dict.itervalues():
+                item.stream_xml(fh)
 
-    # Write out lattices
-    geo_str += "\n"
-    for item in lat_dict.keys():
-        geo_str += lat_dict[item].write_xml()
+            # Write out lattices
+            fh.write("\n")
+            for item in lat_dict.itervalues():
+                item.stream_xml(fh)
 
-    # Write out footer info
-    geo_str += \
-"""\n</geometry>"""
-    with open('geometry.xml','w') as fh:
-        fh.write(geo_str)
+            # Write out footer info
+            fh.write("""\n</geometry>""")
+        count_file(os.path.join(path, 'geometry.xml'))
 
 ############ Materials File ##############
 
-    # Heading info
-    mat_str = ""
-    mat_str += \
-"""<?xml version="1.0" encoding="UTF-8"?>\n<materials>\n\n"""
+    if changed('materials.xml'):
+        with open(os.path.join(path, 'materials.xml'), 'w', xml_buffer_size) as fh:
 
-    # Write out materials
-    for item in mat_dict.keys():
-        mat_str += mat_dict[item].write_xml()
-        mat_str += "\n"
+            # Heading info
+            fh.write("""<?xml version="1.0" encoding="UTF-8"?>\n<materials>\n\n""")
 
-    # Write out footer info
-    mat_str += \
-"""</materials>"""
-    with open('materials.xml','w') as fh:
-        fh.write(mat_str)
+            # Write out materials
+            for item in unique_values(mat_dict):
+                item.stream_xml(fh)
+                fh.write("\n")
 
-############ Settings File ##############
+            # Write out footer info
+            fh.write("""</materials>""")
+        count_file(os.path.join(path, 'materials.xml'))
 
-    settings.update({
-'xbot' : -assy_pitch/2.0,
-'ybot' : -assy_pitch/2.0,
-'zbot' : axial_surfaces['baf'],
-'xtop' : assy_pitch/2.0,
-'ytop' : assy_pitch/2.0,
-'ztop' : axial_surfaces['taf'],
-'entrX' : 1,
-'entrY' : 1,
-'entrZ' : n_water
-    })
+############ Settings File ##############
 
     set_str = """<?xml version="1.0" encoding="UTF-8"?>
 <settings>
@@ -1694,20 +1990,24 @@ def write_openmc_input():
   <!-- Run CMFD -->
   <run_cmfd> {run_cmfd} </run_cmfd>
 
-</settings>""".format(**settings)
-    with open('settings.xml','w') as fh:
-        fh.write(set_str)
+</settings>"""
+    if changed('settings.xml'):
+        with open(os.path.join(path, 'settings.xml'), 'w') as fh:
+            fh.write(set_str.format(**settings))
+        count_file(os.path.join(path, 'settings.xml'))
 
 ############ Plots File ##############
 
-    plot_str = """<?xml version="1.0" encoding="UTF-8"?>\n"""
-    plot_str += """<plots>\n"""
-    for item in plot_dict.keys():
-        plot_str += plot_dict[item].write_xml()
-        plot_str += "\n"
-    plot_str += """</plots>""".format(x = assy_pitch+5, y = assy_pitch+5)
-    with open('plots.xml','w') as fh:
-        fh.write(plot_str)
+    if changed('plots.xml'):
+        with open(os.path.join(path, 'plots.xml'), 'w', xml_buffer_size) as fh:
+            fh.write("""<?xml version="1.0" encoding="UTF-8"?>\n""")
+            fh.write("""<plots>\n""")
+            col_spec = color_specs()
+            for item in plot_dict.itervalues():
+                item.stream_xml(fh, col_spec)
+                fh.write("\n")
+            fh.write("""</plots>""")
+        count_file(os.path.join(path, 'plots.xml'))
 
 ############ CMFD File ###############
 
@@ -1719,7 +2019,7 @@ def write_openmc_input():
     <lower_left>{lower_left}</lower_left>
     <upper_right>{upper_right}</upper_right>
     <dimension>{dimension}</dimension>
-    <albedo>1.0 1.0 1.0 1.0 0.0 0.0</albedo>
+    <albedo>{albedo}</albedo>
     <map>
 {map}
     </map>
@@ -1764,9 +2064,15 @@ def write_openmc_input():
   <downscatter> true </downscatter>
   <power_monitor> true </power_monitor>
 </cmfd>
-""".format(**cmfd)
-    with open('cmfd.xml','w') as fh:
-        fh.write(cmfd_str)
+"""
+    if changed('cmfd.xml'):
+        with open(os.path.join(path, 'cmfd.xml'), 'w') as fh:
+            fh.write(cmfd_str.format(**cmfd))
+        count_file(os.path.join(path, 'cmfd.xml'))
+
+    # Remember what was written
+    with open(os.path.join(path, deck_hash_file), 'w') as fh:
+        json.dump(hashes, fh, indent=2)
 
 if __name__ == '__main__':
     main()
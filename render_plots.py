@@ -0,0 +1,126 @@
+#!/usr/bin/env python2
+
+# Packages
+import os
+import sys
+import zlib
+import struct
+import numpy as np
+from multiprocessing import Pool
+from geometry import *
+
+# Render options
+image_format = 'png' # png or ppm
+n_procs = None       # worker processes, None uses all cores
+output_dir = '.'
+
+# Geometry and colors shared with the forked workers
+_geometry = None
+_colors = {}
+
+def main():
+
+    # Build the model and render all of its plots
+    import make_assembly
+    make_assembly.build_model()
+    if len(sys.argv) > 1:
+        render_plots(fmt = sys.argv[1])
+    else:
+        render_plots()
+
+def render_plots(keys=None, fmt=image_format, procs=n_procs, path=output_dir):
+
+    # Compile the geometry once, the workers inherit it when they fork
+    global _geometry, _colors
+    _geometry = Geometry()
+    _colors = dict([(mat.id, mat.color) for mat in unique_values(mat_dict)])
+    if keys == None:
+        keys = plot_dict.keys()
+    jobs = [(key, fmt, path) for key in keys]
+    pool = Pool(procs)
+    try:
+        files = pool.map(render_plot, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+    return files
+
+def render_plot(job):
+
+    # Worker side, classify the pixel centers of one plot and write the image
+    key, fmt, path = job
+    plot = plot_dict[key]
+    if plot.type != 'slice':
+        raise Exception('Only slice plots can be rendered - ' + key)
+    mat, cell = _geometry.find(*pixel_coordinates(plot))
+
+    # Pixel colors
+    if plot.color == 'mat':
+        ids = mat
+        colors = _colors
+    else:
+        ids = cell
+        colors = {}
+    image = color_pixels(ids, colors, plot.background)
+
+    # Write the file
+    filename = os.path.join(path, '{0}.{1}'.format(plot.filename, fmt))
+    if fmt == 'png':
+        write_png(filename, image)
+    elif fmt == 'ppm':
+        write_ppm(filename, image)
+    else:
+        raise Exception('Image format not recognized - ' + fmt)
+    return filename
+
+def pixel_coordinates(plot):
+
+    # Coordinates of the pixel centers, the first row is the top of the plot
+    origin = [float(v) for v in plot.origin.split()]
+    width = [float(v) for v in plot.width.split()]
+    nh, nv = [int(v) for v in plot.pixels.split()]
+    axes = {'xy':(0, 1), 'xz':(0, 2), 'yz':(1, 2)}[plot.basis]
+    h = origin[axes[0]] - 0.5*width[0] + (np.arange(nh) + 0.5)*width[0]/nh
+    v = origin[axes[1]] + 0.5*width[1] - (np.arange(nv) + 0.5)*width[1]/nv
+    coords = [np.empty((nv, nh)) for i in range(3)]
+    coords[axes[0]][:] = h[np.newaxis,:]
+    coords[axes[1]][:] = v[:,np.newaxis]
+    normal = 3 - axes[0] - axes[1]
+    coords[normal].fill(origin[normal])
+    return coords
+
+def color_pixels(ids, colors, background):
+
+    # RGB image from the IDs, IDs without a color get a fixed pseudo-random one
+    uniq, inverse = np.unique(ids, return_inverse=True)
+    palette = np.empty((len(uniq), 3), dtype=np.uint8)
+    for n, item in enumerate(uniq):
+        if item < 0:
+            palette[n] = [int(c) for c in background.split()]
+        elif colors.get(item) != None:
+            palette[n] = [int(c) for c in colors[item].split()]
+        else:
+            palette[n] = np.random.RandomState(int(item)).randint(0, 256, 3)
+    return palette[inverse].reshape(ids.shape + (3,))
+
+def write_ppm(filename, image):
+    with open(filename, 'wb') as fh:
+        fh.write('P6\n{0} {1}\n255\n'.format(image.shape[1], image.shape[0]))
+        fh.write(image.tobytes())
+
+def write_png(filename, image):
+
+    # Truecolor PNG, every scanline uses filter type 0
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + \
+               struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    rows = np.zeros((image.shape[0], image.shape[1]*3 + 1), dtype=np.uint8)
+    rows[:,1:] = image.reshape(image.shape[0], -1)
+    with open(filename, 'wb') as fh:
+        fh.write('\x89PNG\r\n\x1a\n')
+        fh.write(chunk('IHDR', struct.pack('>IIBBBBB', image.shape[1], image.shape[0], 8, 2, 0, 0, 0)))
+        fh.write(chunk('IDAT', zlib.compress(rows.tobytes(), 6)))
+        fh.write(chunk('IEND', ''))
+
+if __name__ == '__main__':
+    main()
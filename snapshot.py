@@ -0,0 +1,305 @@
+#!/usr/bin/env python2
+
+# Packages
+import sys
+import json
+import numpy as np
+from assembly import *
+
+# Sections of a snapshot, load_snapshot reads any subset of them
+snapshot_sections = ['surfaces', 'cells', 'universes', 'lattices', 'materials', 'plots', 'axial', 'settings', 'cmfd']
+
+# Registries rebuilt from the snapshot sections that need them
+section_registries = {
+'surfaces' : ['surfaces'],
+'cells' : ['cells', 'universes'],
+'lattices' : ['lattices'],
+'materials' : ['materials'],
+'plots' : ['plots'],
+'settings' : ['settings'],
+'cmfd' : ['cmfd']
+}
+
+def main():
+
+    # python snapshot.py save model.npz
+    # python snapshot.py write model.npz [geometry.xml materials.xml ...]
+    if len(sys.argv) < 3 or sys.argv[1] not in ('save', 'write'):
+        raise Exception('Usage: snapshot.py save|write snapshot.npz [deck files]')
+    import make_assembly
+    if sys.argv[1] == 'save':
+        make_assembly.build_model()
+        save_snapshot(sys.argv[2], make_assembly.settings, make_assembly.cmfd)
+    else:
+        files = None
+        if len(sys.argv) > 3:
+            files = sys.argv[3:]
+        write_deck(sys.argv[2], files)
+
+def text(value):
+    # None is stored as an empty string
+    if value == None:
+        return ''
+    return value
+
+def optional(value):
+    value = str(value)
+    if value == '':
+        return None
+    return intern_str(value)
+
+def strings(values):
+    return np.array([str(value) for value in values], dtype=str)
+
+def save_snapshot(filename, settings=None, cmfd=None):
+
+    # Column arrays of the active model. Objects stored under several keys
+    # are saved once, with a key column pointing at their row.
+    model = active_model()
+    columns = {}
+
+    # Surfaces
+    surfs = list(unique_values(surf_dict))
+    rows = dict([(id(item), i) for i, item in enumerate(surfs)])
+    columns.update({
+        'surf_keys':strings(surf_dict.keys()),
+        'surf_rows':np.array([rows[id(item)] for item in surf_dict.itervalues()], dtype=int),
+        'surf_id':np.array([item.id for item in surfs], dtype=int),
+        'surf_type':strings([item.type for item in surfs]),
+        'surf_coeffs':strings([item.coeffs for item in surfs]),
+        'surf_bc':strings([text(item.bc) for item in surfs]),
+        'surf_comment':strings([text(item.comment) for item in surfs])})
+
+    # Cells, in writing order
+    cells = cell_dict.values()
+    columns.update({
+        'cell_keys':strings(cell_dict.keys()),
+        'cell_id':np.array([item.id for item in cells], dtype=int),
+        'cell_universe':np.array([item.universe for item in cells], dtype=int),
+        'cell_fill':np.array([-1 if item.fill == None else item.fill for item in cells], dtype=int),
+        'cell_material':np.array([-1 if item.material == None else item.material for item in cells], dtype=int),
+        'cell_surfaces':strings([item.surfaces for item in cells]),
+        'cell_comment':strings([text(item.comment) for item in cells])})
+
+    # Universes and the cell keys of each
+    univs = list(unique_values(univ_dict))
+    rows = dict([(id(item), i) for i, item in enumerate(univs)])
+    columns.update({
+        'univ_keys':strings(univ_dict.keys()),
+        'univ_rows':np.array([rows[id(item)] for item in univ_dict.itervalues()], dtype=int),
+        'univ_id':np.array([item.id for item in univs], dtype=int),
+        'univ_offsets':np.cumsum([0] + [len(item.cells) for item in univs]),
+        'univ_cells':strings([key for item in univs for key in item.cells])})
+
+    # Lattices
+    lats = lat_dict.values()
+    columns.update({
+        'lat_keys':strings(lat_dict.keys()),
+        'lat_id':np.array([item.id for item in lats], dtype=int),
+        'lat_dimension':strings([item.dimension for item in lats]),
+        'lat_lower_left':strings([item.lower_left for item in lats]),
+        'lat_width':strings([item.width for item in lats]),
+        'lat_offsets':np.cumsum([0] + [item.universes.size for item in lats]),
+        'lat_universes':np.concatenate([item.universes.ravel() for item in lats] + [np.zeros(0, dtype=np.int32)]),
+        'lat_comment':strings([text(item.comment) for item in lats])})
+
+    # Materials with their elements and nuclides flattened
+    mats = list(unique_values(mat_dict))
+    rows = dict([(id(item), i) for i, item in enumerate(mats)])
+    columns.update({
+        'mat_keys':strings(mat_dict.keys()),
+        'mat_rows':np.array([rows[id(item)] for item in mat_dict.itervalues()], dtype=int),
+        'mat_id':np.array([item.id for item in mats], dtype=int),
+        'mat_key':strings([item.key for item in mats]),
+        'mat_comment':strings([text(item.comment) for item in mats]),
+        'mat_color':strings([text(item.color) for item in mats]),
+        'mat_sab_name':strings([item.sab.name if item.sab != None else '' for item in mats]),
+        'mat_sab_xs':strings([item.sab.xs if item.sab != None else '' for item in mats])})
+    for name in ('elements', 'nuclides'):
+        parts = [getattr(item, name) for item in mats]
+        columns.update({
+            name+'_offsets':np.cumsum([0] + [len(part) for part in parts]),
+            name+'_name':strings([item.name for part in parts for item in part]),
+            name+'_xs':strings([item.xs for part in parts for item in part]),
+            name+'_value':strings([item.value for part in parts for item in part])})
+
+    # Plots
+    plots = plot_dict.values()
+    columns.update({'plot_keys':strings(plot_dict.keys()),
+                    'plot_id':np.array([item.id for item in plots], dtype=int)})
+    for name in ('origin', 'width', 'basis', 'type', 'color', 'pixels', 'background', 'filename', 'comment'):
+        columns.update({'plot_'+name:strings([text(getattr(item, name)) for item in plots])})
+
+    # Axial regions, grid flags are kept apart from grid numbers
+    axials = axial_dict.values()
+    columns.update({
+        'axial_keys':strings(axial_dict.keys()),
+        'axial_bottom':strings([item.bottom for item in axials]),
+        'axial_top':strings([item.top for item in axials]),
+        'axial_dp':np.array([item.dp for item in axials], dtype=bool),
+        'axial_grid':np.array([int(item.grid) for item in axials], dtype=int),
+        'axial_grid_flag':np.array([isinstance(item.grid, bool) for item in axials], dtype=bool),
+        'axial_water_idx':np.array([item.water_idx for item in axials], dtype=int),
+        'axial_cool_rho':np.array([item.cool_rho for item in axials], dtype=float)})
+
+    # Counters and input dictionaries
+    columns.update({
+        'counters':np.array([model.n_materials, model.n_surfaces, model.n_cells,
+                             model.n_universes, model.n_lattices, model.n_plots], dtype=int),
+        'settings':np.array(json.dumps(settings)),
+        'cmfd':np.array(json.dumps(cmfd))})
+
+    np.savez_compressed(filename, **columns)
+
+def load_snapshot(filename, sections=None):
+
+    # Rebuild the requested sections into the active model's registries and
+    # return the settings and cmfd dictionaries that were asked for. Only
+    # the columns of those sections are read from the file.
+    if sections == None:
+        sections = snapshot_sections
+    for name in sections:
+        if name not in snapshot_sections:
+            raise Exception('Unknown snapshot section - ' + name)
+    model = active_model()
+    data = np.load(filename)
+    inputs = {}
+    try:
+        counters = data['counters']
+        model.n_materials, model.n_surfaces, model.n_cells = [int(n) for n in counters[:3]]
+        model.n_universes, model.n_lattices, model.n_plots = [int(n) for n in counters[3:]]
+
+        if 'surfaces' in sections:
+            load_surfaces(data, model)
+        if 'cells' in sections:
+            load_cells(data, model)
+        if 'universes' in sections:
+            load_universes(data, model)
+        if 'lattices' in sections:
+            load_lattices(data, model)
+        if 'materials' in sections:
+            load_materials(data, model)
+        if 'plots' in sections:
+            load_plots(data, model)
+        if 'axial' in sections:
+            load_axial(data, model)
+        for name in ('settings', 'cmfd'):
+            if name in sections:
+                value = json.loads(str(data[name]))
+                if value != None:
+                    value = dict([(str(k), str(v) if isinstance(v, unicode) else v) for k, v in value.iteritems()])
+                inputs.update({name:value})
+    finally:
+        data.close()
+    return inputs
+
+def load_surfaces(data, model):
+    surfs = []
+    for id, type, coeffs, bc, comment in zip(data['surf_id'], data['surf_type'], data['surf_coeffs'],
+                                             data['surf_bc'], data['surf_comment']):
+        surfs.append(new(Surface, id=int(id), type=intern_str(str(type)), coeffs=str(coeffs),
+                         bc=optional(bc), comment=optional(comment)))
+    model.surf_dict = OrderedDict()
+    model.surf_index = {}
+    for key, row in zip(data['surf_keys'], data['surf_rows']):
+        model.surf_dict.update({str(key):surfs[row]})
+        index_surface(str(key))
+
+def load_cells(data, model):
+    model.cell_dict = OrderedDict()
+    for key, id, univ, fill, mat, surfaces, comment in zip(data['cell_keys'], data['cell_id'], data['cell_universe'],
+                                                           data['cell_fill'], data['cell_material'],
+                                                           data['cell_surfaces'], data['cell_comment']):
+        model.cell_dict.update({str(key):new(Cell, id=int(id), universe=int(univ),
+                                            fill=None if fill < 0 else int(fill),
+                                            material=None if mat < 0 else int(mat),
+                                            surfaces=intern_str(str(surfaces)), comment=optional(comment))})
+
+def load_universes(data, model):
+    offsets = data['univ_offsets']
+    keys = [str(key) for key in data['univ_cells']]
+    univs = []
+    for i, id in enumerate(data['univ_id']):
+        univs.append(new(Universe, id=int(id), cells=keys[offsets[i]:offsets[i+1]]))
+    model.univ_dict = OrderedDict()
+    for key, row in zip(data['univ_keys'], data['univ_rows']):
+        model.univ_dict.update({str(key):univs[row]})
+
+def load_lattices(data, model):
+    model.lat_dict = OrderedDict()
+    offsets = data['lat_offsets']
+    universes = data['lat_universes']
+    for i, (key, id, dim, lleft, width, comment) in enumerate(zip(data['lat_keys'], data['lat_id'],
+                                                                   data['lat_dimension'], data['lat_lower_left'],
+                                                                   data['lat_width'], data['lat_comment'])):
+        dim = intern_str(str(dim))
+        nx, ny = dim.split()
+        univs = universes[offsets[i]:offsets[i+1]].reshape(int(ny), int(nx))
+        model.lat_dict.update({str(key):new(Lattice, id=int(id), type='rectangular', dimension=dim,
+                                           lower_left=intern_str(str(lleft)), width=intern_str(str(width)),
+                                           universes=univs, comment=optional(comment), nx=nx, ny=ny)})
+
+def load_materials(data, model):
+    parts = {}
+    for name, cls in (('elements', Element), ('nuclides', Nuclide)):
+        items = [new(cls, name=intern_str(str(n)), xs=intern_str(str(xs)), value=str(v))
+                 for n, xs, v in zip(data[name+'_name'], data[name+'_xs'], data[name+'_value'])]
+        offsets = data[name+'_offsets']
+        parts.update({name:[items[offsets[i]:offsets[i+1]] for i in range(len(offsets) - 1)]})
+    mats = []
+    for i, (id, key, comment, color, sab_name, sab_xs) in enumerate(zip(data['mat_id'], data['mat_key'],
+                                                                         data['mat_comment'], data['mat_color'],
+                                                                         data['mat_sab_name'], data['mat_sab_xs'])):
+        sab = None
+        if str(sab_name) != '':
+            sab = new(Sab, name=intern_str(str(sab_name)), xs=intern_str(str(sab_xs)))
+        mats.append(new(Material, id=int(id), key=intern_str(str(key)), comment=optional(comment),
+                        color=optional(color), sab=sab, elements=parts['elements'][i],
+                        nuclides=parts['nuclides'][i]))
+    model.mat_dict = OrderedDict()
+    for key, row in zip(data['mat_keys'], data['mat_rows']):
+        model.mat_dict.update({str(key):mats[row]})
+
+def load_plots(data, model):
+    names = ('origin', 'width', 'basis', 'type', 'color', 'pixels', 'background', 'filename', 'comment')
+    columns = [data['plot_'+name] for name in names]
+    model.plot_dict = OrderedDict()
+    for i, (key, id) in enumerate(zip(data['plot_keys'], data['plot_id'])):
+        values = dict([(name, optional(column[i])) for name, column in zip(names, columns)])
+        model.plot_dict.update({str(key):new(Plot, id=int(id), **values)})
+
+def load_axial(data, model):
+    model.axial_dict = OrderedDict()
+    for key, bottom, top, dp, grid, flag, idx, rho in zip(data['axial_keys'], data['axial_bottom'], data['axial_top'],
+                                                         data['axial_dp'], data['axial_grid'], data['axial_grid_flag'],
+                                                         data['axial_water_idx'], data['axial_cool_rho']):
+        grid = bool(grid) if flag else int(grid)
+        model.axial_dict.update({str(key):AxialRegion(str(bottom), str(top), bool(dp), grid, int(idx), float(rho))})
+
+def write_deck(filename, files=None, path='.', force=False):
+
+    # Write deck files from a snapshot, loading only the sections they need
+    import make_assembly
+    if files == None:
+        files = make_assembly.deck_sections.keys()
+    sections = set()
+    for name in files:
+        if not make_assembly.deck_sections.has_key(name):
+            raise Exception('Unknown deck file - ' + name)
+        for item in make_assembly.deck_sections[name]:
+            sections.update(section_registries[item])
+    inputs = load_snapshot(filename, [item for item in snapshot_sections if item in sections])
+    for name, value in inputs.iteritems():
+        if value == None:
+            raise Exception('Snapshot was saved without ' + name)
+        getattr(make_assembly, name).clear()
+        getattr(make_assembly, name).update(value)
+
+    # Snapshots saved before the albedo was a cmfd entry had the fixed
+    # reflective albedo of a single assembly
+    if inputs.has_key('cmfd'):
+        make_assembly.cmfd.setdefault('albedo', '1.0 1.0 1.0 1.0 0.0 0.0')
+    make_assembly.write_openmc_input(force, path, files)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python2
+
+# Packages
+import os
+import sys
+import json
+import time
+from itertools import product
+from collections import OrderedDict
+from multiprocessing import Pool
+
+# Module-level inputs of make_assembly that a sweep may vary, dictionaries
+# are updated with the given entries instead of being replaced
+sweep_params = ['n_water', 'n_densities', 'n_temps', 'settings', 'cmfd', 'hzp_density', 'low_density']
+
+# Example grid, two water meshes at two particle counts
+sweep_grid = OrderedDict([
+('n_water', [25, 50]),
+('settings', [{'particles':1000}, {'particles':10000}])
+])
+output_dir = 'sweep'
+n_procs = None # worker processes, None uses all cores
+manifest_file = 'manifest.json'
+
+def main():
+
+    # Grid from a JSON file if one is given
+    grid = sweep_grid
+    out = output_dir
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as fh:
+            grid = json.load(fh, object_pairs_hook=OrderedDict)
+    if len(sys.argv) > 2:
+        out = sys.argv[2]
+
+    run_sweep(grid, out, n_procs)
+
+def sweep_points(grid):
+
+    # Cartesian product of the grid values
+    for name in grid.keys():
+        if name not in sweep_params:
+            raise Exception('Parameter cannot be swept - ' + name)
+    names = grid.keys()
+    for values in product(*[grid[name] for name in names]):
+        yield OrderedDict(zip(names, values))
+
+def run_sweep(grid, out=output_dir, procs=None):
+
+    # One deck directory per grid point, each built in a fresh process so no
+    # registry state leaks from one point into the next
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    jobs = []
+    for i, point in enumerate(sweep_points(grid)):
+        jobs.append((point, os.path.join(out, 'point_{0:04d}'.format(i))))
+    pool = Pool(procs, maxtasksperchild=1)
+    try:
+        records = pool.map(build_point, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Write manifest
+    with open(os.path.join(out, manifest_file), 'w') as fh:
+        json.dump(records, fh, indent=2)
+    return records
+
+def build_point(job):
+
+    # Worker side, make_assembly is first imported here so its globals start
+    # out pristine in every worker
+    point, directory = job
+    import make_assembly
+    for name, value in point.iteritems():
+        if isinstance(getattr(make_assembly, name), dict):
+            getattr(make_assembly, name).update(value)
+        else:
+            setattr(make_assembly, name, value)
+
+    # Build the deck in its own directory
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    cwd = os.getcwd()
+    start = time.time()
+    os.chdir(directory)
+    try:
+        make_assembly.main()
+        files = OrderedDict([(name, os.path.getsize(name)) for name in sorted(os.listdir('.')) if name.endswith('.xml')])
+    finally:
+        os.chdir(cwd)
+
+    return OrderedDict([
+        ('directory', directory),
+        ('params', point),
+        ('files', files),
+        ('wall_time', time.time() - start)])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python2
+
+# Packages
+import sys
+import json
+import numpy as np
+from multiprocessing import Pool
+from geometry import *
+
+# Sampling options
+n_samples = 10000000 # points sampled over the core box
+batch_size = 1000000 # points per worker task
+seed = 1
+n_procs = None       # worker processes, None uses all cores
+volume_file = 'volumes.json'
+
+# Geometry and sampling box shared with the forked workers
+_geometry = None
+_box = None
+
+def main():
+
+    # Build the model and estimate its volumes
+    import make_assembly
+    make_assembly.build_model()
+    samples = n_samples
+    if len(sys.argv) > 1:
+        samples = int(sys.argv[1])
+    volumes = estimate_volumes(samples)
+    display_volumes(volumes)
+    with open(volume_file, 'w') as fh:
+        json.dump(volumes, fh, indent=2)
+
+def estimate_volumes(samples=n_samples, batch=batch_size, procs=n_procs):
+
+    # Compile the geometry once, the workers inherit it when they fork
+    global _geometry, _box
+    _geometry = Geometry()
+    lower, upper = _geometry.box()
+    if not np.all(np.isfinite(lower)) or not np.all(np.isfinite(upper)):
+        raise Exception('Root universe is not bounded by x, y and z planes')
+    _box = (lower, upper)
+    box_volume = np.prod(upper - lower)
+
+    # Batches are seeded by their index so the result does not depend on the
+    # number of processes
+    jobs = [(i, min(batch, samples - start)) for i, start in enumerate(range(0, samples, batch))]
+    pool = Pool(procs)
+    try:
+        results = pool.map(sample_batch, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Hit counts over all batches
+    mat_hits = {}
+    cell_hits = {}
+    for mats, cells in results:
+        for key, n in mats.iteritems():
+            mat_hits[key] = mat_hits.get(key, 0) + n
+        for key, n in cells.iteritems():
+            cell_hits[key] = cell_hits.get(key, 0) + n
+
+    # Volume and standard error of the binomial estimate
+    analytic = analytic_volumes()
+    volumes = OrderedDict()
+    volumes.update({'samples':samples})
+    volumes.update({'box':[lower.tolist(), upper.tolist()]})
+    for name, hits, exact in (('materials', mat_hits, analytic['materials']),
+                              ('cells', cell_hits, analytic['cells'])):
+        volumes.update({name:OrderedDict()})
+        for key in sorted(hits.keys()):
+            if key < 0:
+                continue
+            p = float(hits[key])/samples
+            item = OrderedDict([
+                ('volume', p*box_volume),
+                ('std_err', box_volume*np.sqrt(p*(1.0 - p)/samples))])
+            if exact.has_key(key):
+                item.update({'analytic':exact[key]})
+            volumes[name].update({key:item})
+    return volumes
+
+def sample_batch(job):
+
+    # Worker side, hit counts per material and per cell of one batch
+    i, n = job
+    lower, upper = _box
+    rng = np.random.RandomState(seed + i)
+    points = lower + (upper - lower)*rng.random_sample((n, 3))
+    mat, cell = _geometry.find(points[:,0], points[:,1], points[:,2])
+    hits = []
+    for ids in (mat, cell):
+        keys, counts = np.unique(ids, return_counts=True)
+        hits.append(dict(zip(keys.tolist(), counts.tolist())))
+    return hits
+
+def analytic_volumes(geometry=None):
+
+    # Exact volumes of cells made of z-planes and centered z-cylinders inside
+    # a lattice element, found by walking the tree down from the root with
+    # the axial extent and the number of copies of each universe
+    if geometry == None:
+        geometry = Geometry()
+    cells = {}
+    inexact = set()
+    lower, upper = geometry.box()
+    walk_universe(geometry, 0, lower[2], upper[2], 1, None, True, cells, inexact)
+    for key in inexact:
+        if cells.has_key(key):
+            del cells[key]
+
+    # A material is exact only if all of its cells are
+    mats = {}
+    for key, cell in geometry.cells.iteritems():
+        if cell.material == None:
+            continue
+        mats.setdefault(cell.material, 0.0)
+        if cells.has_key(key) and mats[cell.material] != None:
+            mats[cell.material] += cells[key]
+        else:
+            mats[cell.material] = None
+    mats = dict([(key, v) for key, v in mats.iteritems() if v != None])
+    return {'materials':mats, 'cells':cells}
+
+def walk_universe(geometry, universe, zlo, zhi, count, element, exact, cells, inexact, lower=None, upper=None,
+                  radii=(0.0, None)):
+
+    # Bounds in the x-y plane of the universe's own coordinates and the radii
+    # of the parent pin cell it fills
+    if lower is None:
+        lower = np.array([-np.inf, -np.inf])
+        upper = np.array([np.inf, np.inf])
+
+    for cell_id, region, fill, material in geometry.universes.get(universe, []):
+
+        # Axial extent of the cell and the pin cell radii it lies between
+        terms = geometry.terms(region)
+        lo, hi = zlo, zhi
+        r_in, r_out = radii
+        cell_exact = exact and terms != None
+        annular = True
+        cell_lower, cell_upper = lower.copy(), upper.copy()
+        for node in terms or []:
+            type, c = geometry.surfaces[node[1]]
+            if type == 'z-plane':
+                if node[2]:
+                    lo = max(lo, c[0])
+                else:
+                    hi = min(hi, c[0])
+            elif type in ('x-plane', 'y-plane'):
+                axis = 'xy'.index(type[0])
+                if node[2]:
+                    cell_lower[axis] = max(cell_lower[axis], c[0])
+                else:
+                    cell_upper[axis] = min(cell_upper[axis], c[0])
+                annular = False
+            elif type == 'z-cylinder' and c[0] == 0.0 and c[1] == 0.0:
+                if node[2]:
+                    r_in = max(r_in, c[2])
+                elif r_out == None or c[2] < r_out:
+                    r_out = c[2]
+            else:
+                cell_exact = False
+        if hi <= lo:
+            continue
+
+        # Descend into lattices and universes, only lattice elements that lie
+        # entirely inside the cell have exact volumes
+        if fill != None:
+            if geometry.lattices.has_key(fill):
+                lleft, width, univs = geometry.lattices[fill]
+                ny, nx = univs.shape
+                x = lleft[0] + width[0]*np.arange(nx + 1)
+                y = lleft[1] + width[1]*np.arange(ny + 1)
+                inside_x = (x[:-1] >= cell_lower[0] - surf_tolerance) & (x[1:] <= cell_upper[0] + surf_tolerance)
+                inside_y = (y[:-1] >= cell_lower[1] - surf_tolerance) & (y[1:] <= cell_upper[1] + surf_tolerance)
+                inside = inside_y[:,np.newaxis] & inside_x[np.newaxis,:]
+                for whole in (True, False):
+                    keys, counts = np.unique(univs[inside == whole], return_counts=True)
+                    for key, n in zip(keys, counts):
+                        walk_universe(geometry, int(key), lo, hi, count*n, width, cell_exact and whole, cells, inexact,
+                                      -0.5*width[:2], 0.5*width[:2])
+            else:
+                walk_universe(geometry, fill, lo, hi, count, element, cell_exact, cells, inexact,
+                              cell_lower, cell_upper, (r_in, r_out))
+            continue
+
+        # Annulus of a pin cell
+        if not cell_exact or not annular or element is None:
+            inexact.add(cell_id)
+            continue
+        if r_out == None:
+            area = element[0]*element[1] - np.pi*r_in**2
+        else:
+            area = np.pi*(r_out**2 - r_in**2)
+        cells[cell_id] = cells.get(cell_id, 0.0) + max(area, 0.0)*(hi - lo)*count
+
+def display_volumes(volumes):
+    print 'Samples: {0}'.format(volumes['samples'])
+    for name in ('materials', 'cells'):
+        print '\n{0:>8} {1:>14} {2:>12} {3:>14}'.format(name[:-1].capitalize(), 'Volume [cm3]', 'Std. err.', 'Analytic')
+        for key, item in volumes[name].iteritems():
+            if item.has_key('analytic'):
+                analytic = '{0:14.6e}'.format(item['analytic'])
+            else:
+                analytic = '{0:>14}'.format('-')
+            print '{0:>8} {1:14.6e} {2:12.4e} {3}'.format(key, item['volume'], item['std_err'], analytic)
+
+if __name__ == '__main__':
+    main()